@@ -0,0 +1,34 @@
+"""
+Micro-benchmark of PathMatcher: matches 100k paths against dozens of
+include/exclude patterns (the goal is well under a second)
+
+Usage: python benchmarks/path_matcher.py
+"""
+import time
+
+from soopervisor.commons.matcher import PathMatcher
+
+N_FILES = 100_000
+
+
+def main():
+    paths = [f'dir-{i % 100}/sub-{i % 7}/file-{i}.py' for i in range(N_FILES)]
+    patterns = [f'dir-{i}' for i in range(0, 100, 5)]
+    patterns += [f'**/*.ext-{i}' for i in range(20)]
+    patterns += ['**/sub-3/*.py']
+
+    start = time.perf_counter()
+    matches = PathMatcher(patterns)
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n_matched = sum(1 for path in paths if matches(path))
+    elapsed = time.perf_counter() - start
+
+    print(f'{len(patterns)} patterns compiled in {compiled * 1000:.2f} ms')
+    print(f'{len(paths):,} paths matched in {elapsed:.3f} s '
+          f'({n_matched:,} matches)')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,12 @@ from typing import Optional, List
 
 import click
 import yaml
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveInt, conint, ByteSize
 from ploomber.io._commander import Commander
 
 from soopervisor import commons
+from soopervisor import tracing
+from soopervisor.enum import Compression
 
 
 class AbstractConfig(BaseModel, abc.ABC):
@@ -21,6 +23,65 @@ class AbstractConfig(BaseModel, abc.ABC):
     include: Optional[List[str]] = None
     exclude: Optional[List[str]] = None
 
+    # max number of concurrent requests when fetching remote metadata
+    # (incremental mode)
+    remote_metadata_workers: PositiveInt = 16
+
+    # compression for the packaged source code (projects without setup.py):
+    # 'gz', 'parallel-gz' (gzip using all CPUs) or 'none' (faster when
+    # building images locally)
+    compression: Compression = Compression.gz
+
+    # gzip compression level (1 is the fastest, 9 the smallest)
+    compression_level: conint(ge=1, le=9) = 6
+
+    # fail before building the Docker image if the packaged files are
+    # larger than this (e.g., 500MB)
+    max_package_size: Optional[ByteSize] = None
+
+    # build the source distribution (projects with setup.py) in an isolated
+    # environment. Set to False to use the current environment, which is
+    # faster and works offline (requires setuptools and wheel)
+    build_isolation: bool = True
+
+    # also build a wheel (projects with setup.py) and install it in the
+    # Docker image, instead of building the package from the source
+    # distribution in the image
+    wheel: bool = False
+
+    # generate a Dockerfile (when adding a new target) whose final image
+    # (based on ubuntu) only has the environment and the code (can also be
+    # set with soopervisor add --multi-stage)
+    multi_stage: bool = False
+
+    # build the dependencies in a separate image ({repository}-deps:{hash}),
+    # pulled from the repository or reused until the lock file changes
+    deps_image: bool = False
+
+    # build with BuildKit, the generated Dockerfile (when adding a new
+    # target with soopervisor add --buildkit) keeps pip and conda downloads
+    # in a cache outside the image
+    buildkit: bool = False
+
+    # build with "docker buildx build --load", untested images (--skip-tests)
+    # are also pushed in the same build
+    buildx: bool = False
+
+    # settings with sensible defaults that are not written to
+    # soopervisor.yaml when adding a new target
+    _TUNING_KEYS = {
+        'remote_metadata_workers',
+        'compression',
+        'compression_level',
+        'max_package_size',
+        'build_isolation',
+        'wheel',
+        'multi_stage',
+        'deps_image',
+        'buildkit',
+        'buildx',
+    }
+
     class Config:
         extra = 'forbid'
 
@@ -82,7 +143,7 @@ class AbstractConfig(BaseModel, abc.ABC):
 
     @classmethod
     def defaults(cls):
-        data = dict(cls())
+        data = cls().dict(exclude=cls._TUNING_KEYS)
         data['backend'] = cls.get_backend_value()
         return data
 
@@ -108,26 +169,27 @@ class AbstractExporter(abc.ABC):
 
     def __init__(self, path_to_config, env_name):
         # initialize configuration and a few checks on it
-        self._cfg = self.CONFIG_CLASS.from_file_with_root_key(
-            path_to_config=path_to_config,
-            env_name=env_name,
-        )
+        with tracing.span('load config'):
+            self._cfg = self.CONFIG_CLASS.from_file_with_root_key(
+                path_to_config=path_to_config,
+                env_name=env_name,
+            )
 
         self._env_name = env_name
 
-        # initialize dag (needed for validation)
-        # TODO: _export also has to find_spec, maybe load it here and
-        # pass it directly to _export?
-        with Commander() as cmdr:
-            spec, _ = commons.find_spec(cmdr=cmdr, name=env_name)
-
-        self._dag = spec.to_dag().render(force=True, show_progress=False)
+        # find the dag spec (needed for validation). The session is shared
+        # with _add and _export so the DAG is only loaded and rendered once
+        with Commander() as cmdr, tracing.span('find spec'):
+            self._session = commons.DAGSession(
+                cmdr=cmdr,
+                name=env_name,
+                max_workers=self._cfg.remote_metadata_workers)
 
         # ensure that the project and the config make sense
         self.validate()
 
         # validate specific details about the target
-        self._validate(self._cfg, self._dag, self._env_name)
+        self._validate(self._cfg, self._session, self._env_name)
 
     def validate(self):
         """
@@ -136,7 +198,11 @@ class AbstractExporter(abc.ABC):
         """
         commons.dependencies.check_lock_files_exist()
 
-    def add(self):
+    def add(self, multi_stage=None, buildkit=None):
+        """
+        Generates the files needed to export. multi_stage and buildkit
+        override the values in soopervisor.yaml, if not None
+        """
         # check that env_name folder does not exist
         path = Path(self._env_name)
 
@@ -148,32 +214,62 @@ class AbstractExporter(abc.ABC):
                 f'A {kind} with name {self._env_name!r} '
                 'already exists, delete or rename it and try again')
 
-        path.mkdir()
+        # ensure the pipeline renders (this also caches the DAG structure
+        # for the next export)
+        with tracing.span('load DAG'):
+            self._session.structure()
 
-        return self._add(cfg=self._cfg, env_name=self._env_name)
+        path.mkdir()
 
-    def export(self, mode, until=None, skip_tests=False):
-        return self._export(cfg=self._cfg,
-                            env_name=self._env_name,
-                            mode=mode,
-                            until=until,
-                            skip_tests=skip_tests)
+        update = {
+            key: value
+            for key, value in dict(multi_stage=multi_stage,
+                                   buildkit=buildkit).items()
+            if value is not None
+        }
+        cfg = self._cfg.copy(update=update)
+
+        with tracing.span('add'):
+            return self._add(cfg=cfg,
+                             env_name=self._env_name,
+                             session=self._session)
+
+    def export(self,
+               mode,
+               until=None,
+               skip_tests=False,
+               ignore_cache=False,
+               retest=False):
+        if ignore_cache:
+            self._session.clear_cache()
+            commons.cache.clear('package')
+
+        if retest:
+            commons.cache.clear('tested-images.json')
+
+        with tracing.span('export'):
+            return self._export(cfg=self._cfg,
+                                env_name=self._env_name,
+                                mode=mode,
+                                until=until,
+                                skip_tests=skip_tests,
+                                session=self._session)
 
     @staticmethod
     @abc.abstractmethod
-    def _validate(cfg, dag, env_name):
+    def _validate(cfg, session, env_name):
         """Validate project before generating exported files
         """
         pass
 
     @staticmethod
     @abc.abstractmethod
-    def _add():
+    def _add(cfg, env_name, session):
         """
         """
         pass
 
     @staticmethod
     @abc.abstractmethod
-    def _export(cfg, env_name, mode, until):
+    def _export(cfg, env_name, mode, until, skip_tests, session):
         pass
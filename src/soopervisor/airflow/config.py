@@ -13,7 +13,8 @@ class AirflowConfig(abc.AbstractConfig):
 
     @classmethod
     def defaults(cls):
-        data = cls(repository='your-repository/name').dict()
+        data = cls(repository='your-repository/name').dict(
+            exclude=cls._TUNING_KEYS)
         data['backend'] = cls.get_backend_value()
         del data['include']
         del data['exclude']
@@ -11,13 +11,14 @@ from ploomber.io._commander import Commander, CommanderStop
 from soopervisor.airflow.config import AirflowConfig
 from soopervisor import commons
 from soopervisor import abc
+from soopervisor import tracing
 
 
 class AirflowExporter(abc.AbstractExporter):
     CONFIG_CLASS = AirflowConfig
 
     @staticmethod
-    def _add(cfg, env_name):
+    def _add(cfg, env_name, session):
         """Export Ploomber project to Airflow
 
         Generates a .py file that exposes a dag variable
@@ -37,7 +38,10 @@ class AirflowExporter(abc.AbstractExporter):
 
             e.copy_template('airflow/Dockerfile',
                             conda=Path('environment.lock.yml').exists(),
-                            setup_py=Path('setup.py').exists())
+                            setup_py=Path('setup.py').exists(),
+                            multi_stage=cfg.multi_stage,
+                            buildkit=cfg.buildkit)
+            commons.docker.write_dockerignore(env_name)
 
             click.echo(
                 f'Airflow DAG declaration saved to {path_out!r}, you may '
@@ -45,7 +49,7 @@ class AirflowExporter(abc.AbstractExporter):
                 '(e.g., set the execution period)')
 
     @staticmethod
-    def _validate(cfg, dag, env_name):
+    def _validate(cfg, session, env_name):
         """
         Validates a project before exporting as an Airflow DAG.
         This runs as a sanity check in the development machine
@@ -53,7 +57,7 @@ class AirflowExporter(abc.AbstractExporter):
         pass
 
     @staticmethod
-    def _export(cfg, env_name, mode, until, skip_tests):
+    def _export(cfg, env_name, mode, until, skip_tests, session):
         """
         Copies the current source code to the target environment folder.
         The code along with the DAG declaration file can be copied to
@@ -61,7 +65,10 @@ class AirflowExporter(abc.AbstractExporter):
         """
         with Commander(workspace=env_name,
                        templates_path=('soopervisor', 'assets')) as e:
-            tasks, args = commons.load_tasks(cmdr=e, name=env_name, mode=mode)
+            tasks, args = commons.load_tasks(cmdr=e,
+                                             name=env_name,
+                                             mode=mode,
+                                             session=session)
 
             if not tasks:
                 raise CommanderStop(f'Loaded DAG in {mode!r} mode has no '
@@ -71,10 +78,11 @@ class AirflowExporter(abc.AbstractExporter):
             pkg_name, target_image = commons.docker.build(
                 e, cfg, env_name, until=until, skip_tests=skip_tests)
 
-            dag_dict = generate_airflow_spec(tasks, args, target_image)
+            with tracing.span('generate spec'):
+                dag_dict = generate_airflow_spec(tasks, args, target_image)
 
-            path_dag_dict_out = Path(pkg_name + '.json')
-            path_dag_dict_out.write_text(json.dumps(dag_dict))
+                path_dag_dict_out = Path(pkg_name + '.json')
+                path_dag_dict_out.write_text(json.dumps(dag_dict))
 
 
 def generate_airflow_spec(tasks, args, target_image):
@@ -68,7 +68,8 @@ class ArgoConfig(abc.AbstractConfig):
 
     @classmethod
     def defaults(cls):
-        data = cls(repository='your-repository/name').dict()
+        data = cls(repository='your-repository/name').dict(
+            exclude=cls._TUNING_KEYS)
         data['backend'] = cls.get_backend_value()
         del data['mounted_volumes']
         del data['include']
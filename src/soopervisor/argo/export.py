@@ -18,6 +18,7 @@ from soopervisor import assets
 from soopervisor import abc
 from soopervisor.commons import docker
 from soopervisor import commons
+from soopervisor import tracing
 from soopervisor.argo.config import ArgoConfig
 
 
@@ -25,11 +26,11 @@ class ArgoWorkflowsExporter(abc.AbstractExporter):
     CONFIG_CLASS = ArgoConfig
 
     @staticmethod
-    def _validate(cfg, dag, env_name):
+    def _validate(cfg, session, env_name):
         pass
 
     @staticmethod
-    def _add(cfg, env_name):
+    def _add(cfg, env_name, session):
         """
         Add Dockerfile
         """
@@ -37,11 +38,14 @@ class ArgoWorkflowsExporter(abc.AbstractExporter):
                        templates_path=('soopervisor', 'assets')) as e:
             e.copy_template('argo-workflows/Dockerfile',
                             conda=Path('environment.lock.yml').exists(),
-                            setup_py=Path('setup.py').exists())
+                            setup_py=Path('setup.py').exists(),
+                            multi_stage=cfg.multi_stage,
+                            buildkit=cfg.buildkit)
+            docker.write_dockerignore(env_name)
             e.success('Done')
 
     @staticmethod
-    def _export(cfg, env_name, mode, until, skip_tests):
+    def _export(cfg, env_name, mode, until, skip_tests, session):
         """
         Build and upload Docker image. Export Argo YAML spec.
         """
@@ -50,7 +54,8 @@ class ArgoWorkflowsExporter(abc.AbstractExporter):
 
             tasks, args = commons.load_tasks(cmdr=cmdr,
                                              name=env_name,
-                                             mode=mode)
+                                             mode=mode,
+                                             session=session)
 
             if not tasks:
                 raise CommanderStop(f'Loaded DAG in {mode!r} mode has no '
@@ -64,12 +69,14 @@ class ArgoWorkflowsExporter(abc.AbstractExporter):
                                                   skip_tests=skip_tests)
 
             cmdr.info('Generating Argo Workflows YAML spec')
-            _make_argo_spec(tasks=tasks,
-                            args=args,
-                            env_name=env_name,
-                            cfg=cfg,
-                            pkg_name=pkg_name,
-                            target_image=target_image)
+
+            with tracing.span('generate spec'):
+                _make_argo_spec(tasks=tasks,
+                                args=args,
+                                env_name=env_name,
+                                cfg=cfg,
+                                pkg_name=pkg_name,
+                                target_image=target_image)
 
             cmdr.info('Submitting jobs to Argo Workflows')
             cmdr.success('Done. Submitted to Argo Workflows')
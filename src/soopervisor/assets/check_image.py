@@ -0,0 +1,52 @@
+"""
+Checks the pipeline inside the Docker image (loads the DAG only once). Prints
+the results as JSON in the last line:
+
+{"checks": [{"name": "...", "passed": true, "error": null}, ...]}
+"""
+import json
+import traceback
+
+from ploomber.spec import DAGSpec
+
+
+def load_dag(state):
+    state['dag'] = DAGSpec.find().to_dag()
+
+
+def status(state):
+    # same as "ploomber status"
+    state['dag'].status()
+
+
+def file_client(state):
+    if 'File' not in state['dag'].clients:
+        raise ValueError('Missing File client. Ensure a File client '
+                         'is configured in your pipeline')
+
+
+CHECKS = [('load DAG', load_dag), ('status', status),
+          ('File client', file_client)]
+
+
+def main():
+    state, results = {}, []
+
+    for name, check in CHECKS:
+        # the other checks need the DAG
+        if results and not results[0]['passed']:
+            results.append(dict(name=name, passed=False, error='Not run'))
+            continue
+
+        try:
+            check(state)
+        except Exception:
+            results.append(
+                dict(name=name, passed=False, error=traceback.format_exc()))
+        else:
+            results.append(dict(name=name, passed=True, error=None))
+
+    print(json.dumps(dict(checks=results)))
+
+
+main()
@@ -10,6 +10,7 @@ from soopervisor.aws.config import AWSBatchConfig
 from soopervisor.commons import docker
 from soopervisor import commons
 from soopervisor import abc
+from soopervisor import tracing
 
 try:
     import boto3
@@ -17,7 +18,6 @@ except ModuleNotFoundError:
     boto3 = None
 
 # TODO:
-# warn on large distribution artifacts - there might be data files
 # make explicit that some errors are happening inside docker
 
 # if pkg is installed --editable, then files inside src/ can find the
@@ -42,16 +42,19 @@ class AWSBatchExporter(abc.AbstractExporter):
     CONFIG_CLASS = AWSBatchConfig
 
     @staticmethod
-    def _validate(cfg, dag, env_name):
+    def _validate(cfg, session, env_name):
         pass
 
     @staticmethod
-    def _add(cfg, env_name):
+    def _add(cfg, env_name, session):
         with Commander(workspace=env_name,
                        templates_path=('soopervisor', 'assets')) as e:
             e.copy_template('aws-batch/Dockerfile',
                             conda=Path('environment.lock.yml').exists(),
-                            setup_py=Path('setup.py').exists())
+                            setup_py=Path('setup.py').exists(),
+                            multi_stage=cfg.multi_stage,
+                            buildkit=cfg.buildkit)
+            docker.write_dockerignore(env_name)
             e.success('Done')
             e.print(
                 f'Fill in the configuration in the {env_name!r} '
@@ -62,12 +65,13 @@ class AWSBatchExporter(abc.AbstractExporter):
 
     @staticmethod
     @requires(['boto3'], name='AWSBatchExporter')
-    def _export(cfg, env_name, mode, until, skip_tests):
+    def _export(cfg, env_name, mode, until, skip_tests, session):
         with Commander(workspace=env_name,
                        templates_path=('soopervisor', 'assets')) as cmdr:
             tasks, args = commons.load_tasks(cmdr=cmdr,
                                              name=env_name,
-                                             mode=mode)
+                                             mode=mode,
+                                             session=session)
 
             if not tasks:
                 raise CommanderStop(f'Loaded DAG in {mode!r} mode has no '
@@ -82,14 +86,15 @@ class AWSBatchExporter(abc.AbstractExporter):
 
             cmdr.info('Submitting jobs to AWS Batch')
 
-            submit_dag(tasks=tasks,
-                       args=args,
-                       job_def=pkg_name,
-                       remote_name=remote_name,
-                       job_queue=cfg.job_queue,
-                       container_properties=cfg.container_properties,
-                       region_name=cfg.region_name,
-                       cmdr=cmdr)
+            with tracing.span('submit'):
+                submit_dag(tasks=tasks,
+                           args=args,
+                           job_def=pkg_name,
+                           remote_name=remote_name,
+                           job_queue=cfg.job_queue,
+                           container_properties=cfg.container_properties,
+                           region_name=cfg.region_name,
+                           cmdr=cmdr)
 
             cmdr.success('Done. Submitted to AWS Batch')
 
@@ -20,9 +20,10 @@ class AWSBatchConfig(AbstractConfig):
 
     @classmethod
     def defaults(cls):
-        data = cls(repository='your-repository/name',
-                   job_queue='your-job-queue',
-                   region_name='your-region-name').dict()
+        data = cls(
+            repository='your-repository/name',
+            job_queue='your-job-queue',
+            region_name='your-region-name').dict(exclude=cls._TUNING_KEYS)
         data['backend'] = cls.get_backend_value()
         del data['include']
         del data['exclude']
@@ -12,26 +12,37 @@ from soopervisor.aws.config import AWSLambdaConfig
 from soopervisor.commons.conda import generate_reqs_txt_from_env_yml
 from soopervisor import commons
 from soopervisor import abc
+from soopervisor import tracing
 
 
 class AWSLambdaExporter(abc.AbstractExporter):
     CONFIG_CLASS = AWSLambdaConfig
 
-    def export(self, mode=None, until=None, skip_tests=False):
+    def export(self,
+               mode=None,
+               until=None,
+               skip_tests=False,
+               ignore_cache=False,
+               retest=False):
         if mode is not None:
             raise ValueError("AWS Lambda does not support 'mode'")
 
-        return self._export(cfg=self._cfg,
-                            env_name=self._env_name,
-                            until=until,
-                            skip_tests=skip_tests)
+        if ignore_cache:
+            self._session.clear_cache()
+
+        with tracing.span('export'):
+            return self._export(cfg=self._cfg,
+                                env_name=self._env_name,
+                                until=until,
+                                skip_tests=skip_tests,
+                                session=self._session)
 
     @staticmethod
-    def _validate(cfg, dag, env_name):
+    def _validate(cfg, session, env_name):
         pass
 
     @staticmethod
-    def _add(cfg, env_name):
+    def _add(cfg, env_name, session):
         try:
             pkg_name = default.find_package_name()
         except ValueError as e:
@@ -61,7 +72,7 @@ class AWSLambdaExporter(abc.AbstractExporter):
                 warn_if_not_installed(name)
 
     @staticmethod
-    def _export(cfg, env_name, until, skip_tests):
+    def _export(cfg, env_name, until, skip_tests, session):
 
         # TODO: validate project structure: src/*/model.*, etc...
 
@@ -96,22 +107,27 @@ class AWSLambdaExporter(abc.AbstractExporter):
 
             # TODO: ensure user has pytest before running
             if not skip_tests:
-                e.run('pytest', env_name, description='Testing')
+                with tracing.span('test'):
+                    e.run('pytest', env_name, description='Testing')
 
             e.rm('dist', 'build')
-            e.run('python',
-                  '-m',
-                  'build',
-                  '--wheel',
-                  '.',
-                  description='Packaging')
+
+            with tracing.span('package code'):
+                e.run('python',
+                      '-m',
+                      'build',
+                      '--wheel',
+                      '.',
+                      description='Packaging')
+
             e.cp('dist')
 
             e.cd(env_name)
 
             # TODO: template.yaml with version number
 
-            e.run('sam', 'build', description='Building Docker image')
+            with tracing.span('docker build'):
+                e.run('sam', 'build', description='Building Docker image')
 
             if until == 'build':
                 e.tw.write(
@@ -128,6 +144,7 @@ class AWSLambdaExporter(abc.AbstractExporter):
                 args.append('--guided')
                 e.info('Starting guided deployment...')
 
-            e.run(*args, description='Deploying')
+            with tracing.span('deploy'):
+                e.run(*args, description='Deploying')
 
             e.success('Deployed to AWS Lambda')
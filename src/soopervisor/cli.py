@@ -1,13 +1,15 @@
 from pathlib import Path
 
-import yaml
 import click
 
 from soopervisor import __version__
-from soopervisor import config
 from soopervisor import exporter
+from soopervisor import tracing
 from soopervisor.enum import Backend, Mode
 
+# NOTE: modules with heavy dependencies (yaml, ploomber, pydantic, etc.) are
+# imported inside the commands to keep "soopervisor --help" fast
+
 
 @click.group()
 @click.version_option(version=__version__)
@@ -31,9 +33,21 @@ def cli():
               '-b',
               type=click.Choice(Backend.get_values()),
               required=True)
-def add(name, backend):
+@click.option('--multi-stage/--no-multi-stage',
+              default=None,
+              help='Generate a Dockerfile whose final image (based on '
+              'ubuntu) only has the environment and the code')
+@click.option('--buildkit',
+              is_flag=True,
+              help='Keep pip and conda downloads in a BuildKit cache')
+@click.option('--profile',
+              is_flag=True,
+              help='Record the time spent on each phase')
+def add(name, backend, multi_stage, buildkit, profile):
     """Add a new target platform
     """
+    import yaml
+
     backend = Backend(backend)
 
     if Path('soopervisor.yaml').exists():
@@ -48,12 +62,14 @@ def add(name, backend):
         raise click.ClickException(f'{name!r} already exists. '
                                    'Select a different name.')
 
-    Exporter = exporter.for_backend(backend)
-    Exporter('soopervisor.yaml', env_name=name).add()
+    with tracing.record(_path_to_profile('add', name), enabled=profile):
+        Exporter = exporter.for_backend(backend)
+        Exporter('soopervisor.yaml', env_name=name).add(
+            multi_stage=multi_stage, buildkit=buildkit or None)
 
 
 @cli.command()
-@click.argument('name')
+@click.argument('names', nargs=-1, required=True, metavar='NAME...')
 @click.option('--until-build',
               '-ub',
               is_flag=True,
@@ -62,30 +78,56 @@ def add(name, backend):
               '-s',
               is_flag=True,
               help='Skip docker image tests')
+@click.option('--retest',
+              is_flag=True,
+              help='Test the docker image even if it passed the tests before')
 @click.option('--mode',
               '-m',
               type=click.Choice(Mode.get_values()),
               default=Mode.incremental.value)
-def export(name, until_build, mode, skip_tests):
+@click.option('--ignore-cache',
+              is_flag=True,
+              help='Ignore the cached DAG structure and packaged code')
+@click.option('--profile',
+              is_flag=True,
+              help='Record the time spent on each phase')
+def export(names, until_build, mode, skip_tests, retest, ignore_cache,
+           profile):
     """
-    Export a target platform for execution/deployment
+    Export one or more target platforms for execution/deployment. Targets
+    with the same Dockerfile, lock file and code share the image
     """
+    from soopervisor import config
+
     until = None
 
     if until_build:
         until = 'build'
 
-    backend = Backend(config.get_backend(name))
+    path_to_profile = _path_to_profile('export', '-'.join(names))
+
+    with tracing.record(path_to_profile, enabled=profile):
+        for name in names:
+            backend = Backend(config.get_backend(name))
+
+            # TODO: ignore mode if using aws lambda, raised exception if value
+            # is not the default
+            mode_target = None if backend == Backend.aws_lambda else mode
+
+            Exporter = exporter.for_backend(backend)
+            Exporter('soopervisor.yaml',
+                     env_name=name).export(mode=mode_target,
+                                           until=until,
+                                           skip_tests=skip_tests,
+                                           ignore_cache=ignore_cache,
+                                           retest=retest)
+
+            # targets with the same image reuse the test results
+            retest = False
 
-    # TODO: ignore mode if using aws lambda, raised exception if value
-    # is not the default
-    if backend == Backend.aws_lambda:
-        mode = None
 
-    Exporter = exporter.for_backend(backend)
-    Exporter('soopervisor.yaml', env_name=name).export(mode=mode,
-                                                       until=until,
-                                                       skip_tests=skip_tests)
+def _path_to_profile(command, name):
+    return Path('.soopervisor', 'profile', f'{command}-{name}.json')
 
 
 if __name__ == '__main__':
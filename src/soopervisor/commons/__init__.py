@@ -1,5 +1,5 @@
-from soopervisor.commons import conda, docker, source, dependencies
-from soopervisor.commons.dag import load_tasks, find_spec
+from soopervisor.commons import conda, docker, source, dependencies, cache
+from soopervisor.commons.dag import load_tasks, find_spec, DAGSession
 
 __all__ = [
     'conda',
@@ -7,5 +7,7 @@ __all__ = [
     'source',
     'load_tasks',
     'find_spec',
+    'DAGSession',
     'dependencies',
+    'cache',
 ]
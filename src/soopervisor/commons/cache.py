@@ -0,0 +1,127 @@
+"""
+Local cache to speed up repeated exports. Entries are stored as JSON files
+in .soopervisor/cache/
+"""
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+
+_CACHE_DIR = Path('.soopervisor', 'cache')
+
+
+def path_to_cache(*parts):
+    """Returns a path inside the cache directory
+    """
+    return Path(_CACHE_DIR, *parts)
+
+
+def hash_file(path, algorithm='sha256'):
+    """Returns the hex digest of a file's content
+    """
+    h = hashlib.new(algorithm)
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def hash_files(paths):
+    """
+    Returns a mapping with the hex digest of each file, None if the file
+    does not exist
+    """
+    return {
+        str(path): hash_file(path) if Path(path).is_file() else None
+        for path in paths
+    }
+
+
+def fingerprint(paths):
+    """
+    Returns a digest of the names and contents of the given files. Digests
+    of files whose size and modification time did not change since the last
+    call are read from the cache instead of hashing the files again
+    """
+    path = path_to_cache('hashes.json')
+    known = load(path) or {}
+    hashes = {}
+
+    for f in paths:
+        stat = os.stat(f)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        entry = known.get(str(f))
+
+        if entry is not None and entry[0] == stamp:
+            digest = entry[1]
+        else:
+            digest = hash_file(f)
+
+        hashes[str(f)] = [stamp, digest]
+
+    store(path, hashes)
+    return hash_object({f: digest for f, (_, digest) in hashes.items()})
+
+
+def hash_object(obj):
+    """Returns the hex digest of a JSON-serializable object
+    """
+    serialized = json.dumps(obj, sort_keys=True).encode()
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def load(path):
+    """Loads a JSON cache entry, returns None if missing or corrupted
+    """
+    path = Path(path)
+
+    if not path.is_file():
+        return None
+
+    try:
+        return json.loads(path.read_text())
+    except ValueError:
+        return None
+
+
+def store(path, data):
+    """Stores a JSON cache entry
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+
+
+def clear(*parts):
+    """Deletes the cache directory (or a path inside it)
+    """
+    path = path_to_cache(*parts)
+
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def evict(*parts, keep):
+    """
+    Keeps the most recently used entries in a cache directory (by
+    modification time), deletes the rest
+    """
+    path = path_to_cache(*parts)
+
+    if not path.is_dir():
+        return
+
+    entries = sorted(path.iterdir(),
+                     key=lambda p: p.stat().st_mtime,
+                     reverse=True)
+
+    for entry in entries[keep:]:
+        if entry.is_dir():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
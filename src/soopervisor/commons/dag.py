@@ -1,36 +1,315 @@
 """
 Loading dags
 """
-from ploomber.constants import TaskStatus
+from pathlib import Path
+from collections.abc import Mapping
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import yaml
+import ploomber
 from ploomber.spec import DAGSpec
+from ploomber.dag import dag as dag_module
+from ploomber.products import File, MetaProduct
+from ploomber.util import default
 from ploomber.exceptions import DAGSpecInvalidError
 
+from soopervisor import __version__
+from soopervisor import tracing
 from soopervisor.enum import Mode
+from soopervisor.commons import cache
 
 
-def find_spec(cmdr, name):
+def find_spec_path(cmdr, name):
     """
-    Find spec to use. It first tries to load a file with pipeline.{name}.yaml,
-    if that doesn't exist, it tries to load a pipeline.yaml
+    Find the relative path to the spec to use. It first tries to find a file
+    with pipeline.{name}.yaml, if that doesn't exist, it tries to find a
+    pipeline.yaml. Unlike find_spec, this does not initialize the spec
     """
     cmdr.info('Loading DAG')
 
     try:
-        spec, relative_path = DAGSpec._find_relative(name=name)
-        cmdr.print(f'Found {spec.path!s}. Loading...')
+        relative_path = default.entry_point_relative(name=name)
     except DAGSpecInvalidError:
         cmdr.print(f'No pipeline.{name}.yaml found, '
                    'looking for pipeline.yaml instead')
-        spec = None
+        relative_path = None
+
+    if relative_path is None:
+        relative_path = default.entry_point_relative()
+
+    cmdr.print(f'Found {Path(relative_path).resolve()!s}. Loading...')
+
+    return relative_path
+
+
+def find_spec(cmdr, name):
+    """
+    Find spec to use. It first tries to load a file with pipeline.{name}.yaml,
+    if that doesn't exist, it tries to load a pipeline.yaml
+    """
+    relative_path = find_spec_path(cmdr=cmdr, name=name)
+    return DAGSpec(relative_path), relative_path
+
+
+class DAGSession:
+    """
+    Finds the spec and renders the DAG once so every exporting step
+    (validate, add and export) shares the same objects
+
+    Parameters
+    ----------
+    cmdr : Commander
+        Commander instance used to print output
+
+    name : str
+        Target environment name. This prioritizes loading a
+        pipeline.{name}.yaml spec, if such doesn't exist, it loads a
+        pipeline.yaml
+
+    max_workers : int, default=16
+        Maximum number of concurrent requests when fetching remote metadata
+
+    Notes
+    -----
+    The spec is initialized and the DAG is rendered with force=True
+    (no status checks, nor remote metadata downloads) the first time they're
+    requested. If remote status is needed (incremental mode), it is computed
+    on the already rendered DAG instead of rendering it again.
+
+    The DAG structure (task names and upstream dependencies) is cached in
+    .soopervisor/cache/dag/, if the spec, env files and task sources haven't
+    changed since the last time, structure() returns the cached value
+    without importing or rendering the DAG. DAGs built by a factory
+    (location in the spec) are not cached
+    """
+    def __init__(self, cmdr, name=None, max_workers=16):
+        self.relative_path = find_spec_path(cmdr=cmdr, name=name)
+        self._max_workers = max_workers
+        self._spec = None
+        self._dag = None
+
+    @property
+    def spec(self):
+        if self._spec is None:
+            self._spec = DAGSpec(self.relative_path)
+
+        return self._spec
+
+    def render(self):
+        """Render the DAG with force=True, if it hasn't been rendered yet
+        """
+        if self._dag is None:
+            with tracing.span('render DAG'), _no_remote_metadata_fetch():
+                self._dag = self.spec.to_dag().render(force=True,
+                                                      show_progress=False)
+
+        return self._dag
+
+    @property
+    def dag(self):
+        return self.render()
+
+    def structure(self):
+        """
+        Returns a dictionary with all tasks (keys) and their upstream
+        dependencies (values)
+        """
+        path = self._path_to_cache()
+        key = self._cache_key()
+        entry = None if key is None else cache.load(path)
+
+        if (entry is not None and entry['key'] == key
+                and cache.hash_files(entry['sources']) == entry['sources']):
+            return entry['tasks']
+
+        dag = self.render()
+        tasks = {name: list(task.upstream) for name, task in dag.items()}
+
+        if key is not None:
+            sources = cache.hash_files(_source_files(dag))
+            cache.store(path, dict(key=key, sources=sources, tasks=tasks))
+
+        return tasks
+
+    def clear_cache(self):
+        """Deletes the cached DAG structure
+        """
+        cache.clear('dag', self._path_to_cache().name)
+
+    def outdated(self):
+        """
+        Returns the names of the tasks whose products are outdated with
+        respect to the remote metadata
+        """
+        # a force render skips status checks, so we compute them here using
+        # the products in the already rendered DAG
+        return resolve_outdated(self.dag, max_workers=self._max_workers)
+
+    def _path_to_cache(self):
+        name = cache.hash_object(self.relative_path)[:16]
+        return cache.path_to_cache('dag', f'{name}.json')
+
+    def _cache_key(self):
+        """
+        Returns the key for the cached structure, None if the structure
+        can't be cached
+        """
+        spec = yaml.safe_load(Path(self.relative_path).read_text())
+
+        # the tasks are defined in python code, which may import anything
+        if isinstance(spec, Mapping) and 'location' in spec:
+            return None
+
+        # spec, env and partial files live next to the spec
+        parent = Path(self.relative_path).parent
+        files = set(parent.glob('*.yaml')) | set(Path('.').glob('env*.yaml'))
+
+        # partial files may be anywhere
+        meta = (spec.get('meta') if isinstance(spec, Mapping) else None) or {}
+
+        if meta.get('import_tasks_from'):
+            files.add(Path(parent, meta['import_tasks_from']))
+
+        return cache.hash_object({
+            'files': cache.hash_files(sorted(files)),
+            'soopervisor': __version__,
+            'ploomber': ploomber.__version__,
+        })
 
-    if spec is None:
-        spec, relative_path = DAGSpec._find_relative()
-        cmdr.print(f'Found {spec.path!s}. Loading...')
 
-    return spec, relative_path
+@contextmanager
+def _no_remote_metadata_fetch():
+    """
+    Ploomber fetches the remote metadata of all products (64 concurrent
+    requests) when rendering, even with force=True, which doesn't use it.
+    Disable it so resolve_outdated is the only place where it's fetched
+    """
+    original = getattr(dag_module, 'fetch_remote_metadata_in_parallel', None)
+
+    if original is None:
+        yield
+        return
+
+    dag_module.fetch_remote_metadata_in_parallel = lambda dag: None
+
+    try:
+        yield
+    finally:
+        dag_module.fetch_remote_metadata_in_parallel = original
+
+
+def fetch_remote_metadata(files, max_workers=16):
+    """Fetches the remote metadata of File products concurrently
+
+    Parameters
+    ----------
+    files : list
+        File products to fetch metadata for
+
+    max_workers : int, default=16
+        Maximum number of concurrent requests
+    """
+    if not files:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future2file = {
+            executor.submit(file._remote._fetch_remote_metadata): file
+            for file in files
+        }
+
+        for future in as_completed(future2file):
+            exception = future.exception()
+
+            if exception:
+                file = future2file[future]
+                raise RuntimeError(
+                    'An error occurred when fetching '
+                    f'remote metadata for {file!r}') from exception
+
+
+def resolve_outdated(dag, max_workers=16):
+    """
+    Determines which tasks are outdated with respect to the remote metadata.
+    It first collects all File products with a configured client, fetches
+    their remote metadata concurrently, and then computes the status (which
+    only reads the already fetched metadata)
+
+    Parameters
+    ----------
+    dag : DAG
+        A rendered DAG
+
+    max_workers : int, default=16
+        Maximum number of concurrent requests when fetching remote metadata
+
+    Returns
+    -------
+    list
+        Names of the outdated tasks
+    """
+    files = _files_with_client(dag)
+
+    with tracing.span('fetch remote metadata'):
+        fetch_remote_metadata(files, max_workers=max_workers)
+
+    with tracing.span('compute status'):
+        return [
+            name for name, task in dag.items()
+            if task.product._is_remote_outdated(outdated_by_code=True)
+        ]
+
+
+def _files_with_client(dag):
+    """
+    Returns all File products (including the ones in a MetaProduct) with a
+    configured client
+    """
+    files = []
+
+    for task in dag.values():
+        product = task.product
+        products = (list(product)
+                    if isinstance(product, MetaProduct) else [product])
+        files.extend(p for p in products
+                     if isinstance(p, File) and p.client is not None)
+
+    return files
+
+
+def _source_files(dag):
+    """Returns the paths to the source files used by the DAG tasks
+    """
+    paths = set()
 
+    for task in dag.values():
+        loc = task.source.loc
 
-def load_tasks(cmdr, name=None, mode='incremental'):
+        if loc is None:
+            continue
+
+        # python callables have a "path:line" location
+        path, _, line = str(loc).rpartition(':')
+
+        if not (path and line.isdigit()):
+            path = str(loc)
+
+        path = Path(path)
+
+        if path.is_file():
+            # keep paths relative so the cache is valid if the project moves
+            try:
+                path = path.resolve().relative_to(Path('.').resolve())
+            except ValueError:
+                pass
+
+            paths.add(str(path))
+
+    return sorted(paths)
+
+
+def load_tasks(cmdr, name=None, mode='incremental', session=None):
     """Load tasks names and their upstream dependencies
 
     Parameters
@@ -49,6 +328,9 @@ def load_tasks(cmdr, name=None, mode='incremental'):
         determine status at runtime) or 'force' (ignore status, submit all
         tasks and force execution regardless of status)
 
+    session : DAGSession, default=None
+        Session with the already loaded DAG. If None, a new one is created
+
     Returns
     -------
     task : dict
@@ -60,33 +342,28 @@ def load_tasks(cmdr, name=None, mode='incremental'):
     """
     valid = Mode.get_values()
 
-    spec, relative_path = find_spec(cmdr=cmdr, name=name)
-    dag = spec.to_dag()
+    if session is None:
+        session = DAGSession(cmdr=cmdr, name=name)
 
     if mode not in valid:
         raise ValueError(f'mode must be one of {valid!r}')
 
-    if mode == 'incremental':
-        dag.render(remote=True)
-
-        tasks = []
-
-        for name, task in dag.items():
-            if not mode or task.exec_status != TaskStatus.Skipped:
-                tasks.append(name)
-    else:
-        # force makes rendering faster. we just need this to ensure the
-        # pipeline does not have any rendering problems before proceeding
-        dag.render(force=True)
-
-        tasks = list(dag.keys())
+    with tracing.span('load tasks'):
+        if mode == 'incremental':
+            structure = {
+                name: list(session.dag[name].upstream)
+                for name in session.outdated()
+            }
+        else:
+            # regular and force only need the structure, which may be cached
+            structure = session.structure()
 
     out = {}
 
-    for t in tasks:
-        out[t] = [name for name in dag[t].upstream.keys() if name in tasks]
+    for t, upstream in structure.items():
+        out[t] = [name for name in upstream if name in structure]
 
-    args = [f'--entry-point {relative_path}']
+    args = [f'--entry-point {session.relative_path}']
 
     if mode == 'force':
         args.append('--force')
@@ -1,9 +1,48 @@
+import os
+import re
+import json
+import shutil
+import tarfile
+import subprocess
 import importlib
 from pathlib import Path
+from contextlib import contextmanager
+from collections.abc import Mapping
 
+try:
+    import importlib.resources as pkg_resources
+except ImportError:
+    # if python<3.7
+    import importlib_resources as pkg_resources
+
+import yaml
+from click.exceptions import ClickException
 from ploomber.util import default
 from ploomber.io._commander import CommanderStop
-from soopervisor.commons import source, dependencies
+from soopervisor.commons import source, dependencies, cache
+from soopervisor.commons.matcher import PathMatcher
+from soopervisor import tracing, assets, __version__
+
+# number of packaged projects to keep in the cache
+_PACKAGES_TO_KEEP = 3
+
+# number of tested images to keep in the ledger
+_TESTED_IMAGES_TO_KEEP = 100
+
+# images built in this process (content key -> (image, tested)), targets
+# exported together (soopervisor export a b) with the same content share them
+_built_images = {}
+
+# the "deps" stage, up to the next FROM line
+_DEPS_STAGE = re.compile(r'^FROM\s.*\sAS\s+deps\s*$.*?(?=^FROM\s|\Z)',
+                         flags=re.MULTILINE | re.DOTALL | re.IGNORECASE)
+
+# the argument with the image the stage after "deps" starts from
+_DEPS_IMAGE_ARG = re.compile(r'^ARG\s+DEPS_IMAGE\b',
+                             flags=re.MULTILINE | re.IGNORECASE)
+
+_DOCKERIGNORE_HEADER = ('# Generated by soopervisor, delete this line to stop '
+                        'updating this file.')
 
 
 def build(e, cfg, name, until, skip_tests=False):
@@ -24,7 +63,8 @@ def build(e, cfg, name, until, skip_tests=False):
         Stop after certain starge
 
     skip_tests : bool, default=False
-        Skip image testing (check dag loading and File.client configuration)
+        Skip image testing (check dag loading and File.client configuration).
+        Images that passed the tests before are not tested again
     """
 
     # if this is a pkg, get the name
@@ -41,73 +81,105 @@ def build(e, cfg, name, until, skip_tests=False):
 
     dependencies.check_lock_files_exist()
 
-    if Path('requirements.lock.txt').exists():
-        e.cp('requirements.lock.txt')
-    elif Path('environment.lock.yml').exists():
-        e.cp('environment.lock.yml')
+    with tracing.span('copy lock file'):
+        if Path('requirements.lock.txt').exists():
+            e.cp('requirements.lock.txt')
+        elif Path('environment.lock.yml').exists():
+            e.cp('environment.lock.yml')
 
     # generate source distribution
+    with tracing.span('package code'):
+        package_key, sizes = _package(e, cfg, pkg_name)
 
-    if Path('setup.py').exists():
-        # .egg-info may cause issues if MANIFEST.in was recently updated
-        e.rm('dist', 'build', Path('src', pkg_name, f'{pkg_name}.egg-info'))
-        e.run('python', '-m', 'build', '--sdist', description='Packaging code')
-
-        # raise error if include is not None? and suggest to use MANIFEST.in
-        # instead
-    else:
-        e.rm('dist')
-        target = Path('dist', pkg_name)
-        e.info('Packaging code')
-        source.copy(cmdr=e,
-                    src='.',
-                    dst=target,
-                    include=cfg.include,
-                    exclude=cfg.exclude)
-        source.compress_dir(target, Path('dist', f'{pkg_name}.tar.gz'))
+    _check_package_size(e, cfg, sizes)
 
     e.cp('dist')
 
     e.cd(name)
 
+    write_dockerignore('.')
+    size, n_files = context_size('.')
+    e.info(f'Docker build context: {source.format_size(size)} '
+           f'({n_files} files)')
+
     image_local = f'{pkg_name}:{version}'
 
-    # how to allow passing --no-cache?
-    e.run('docker',
-          'build',
-          '.',
-          '--tag',
-          image_local,
-          description='Building image')
+    # images with the same content key are built from the same files
+    content_key = cache.hash_object([
+        package_key,
+        cache.hash_file(_lock_file()),
+        Path('Dockerfile').read_text(),
+    ])
+    content_tag = f'content-{content_key[:16]}'
+    image_content = f'{pkg_name}:{content_tag}'
+    remote_content = (f'{cfg.repository}:{content_tag}'
+                      if cfg.repository else None)
 
-    if not skip_tests:
-        # test "ploomber status" in docker image
-        e.run('docker',
-              'run',
-              image_local,
-              'ploomber',
-              'status',
-              description='Testing image',
-              error_message='Error while testing your docker image with',
-              hint=f'Use "docker run -it {image_local} /bin/bash" to '
-              'start an interactive session to debug your image')
-
-        # check that the pipeline in the image has a configured File.client
-        test_cmd = ('from ploomber.spec import DAGSpec; '
-                    'print("File" in DAGSpec.find().to_dag().clients)')
+    if remote_content and _exists_in_registry(remote_content):
+        e.info(f'Image {remote_content} has the same content, '
+               'skipping build')
+
+        if until is not None:
+            raise CommanderStop('Done. An image with the same content '
+                                f'exists: {remote_content}')
+
+        return pkg_name, remote_content
+
+    # remote names the image was pushed with while building it
+    pushed = []
+
+    if _image_exists(image_content):
+        e.info(f'Image {image_content} has the same content, '
+               'skipping build')
         e.run('docker',
-              'run',
+              'tag',
+              image_content,
               image_local,
-              'python',
-              '-c',
-              test_cmd,
-              description='Testing File client',
-              error_message='Missing File client',
-              hint=f'Run "docker run -it {image_local} /bin/bash" to '
-              'to debug your image. Ensure a File client is configured',
-              capture_output=True,
-              expected_output='True\n',
-              show_cmd=False)
+              description='Tagging')
+
+        # the test suite may have changed since the image was tagged
+        if not skip_tests:
+            with tracing.span('test image'):
+                _test_image_once(e, image_local)
+
+        tested = True
+        deps_to_push = None
+    elif content_key in _built_images:
+        image_built, tested = _built_images[content_key]
+        e.info(f'Image {image_built} has the same content, skipping build')
+
+        if image_built != image_local:
+            e.run('docker',
+                  'tag',
+                  image_built,
+                  image_local,
+                  description='Tagging')
+
+        deps_to_push = None
+    else:
+        # buildx uploads untested images while building them
+        if (cfg.buildx and skip_tests and cfg.repository
+                and until != 'build'):
+            pushed = [f'{cfg.repository}:{version}']
+
+        deps_to_push = _build_and_test(e,
+                                       cfg,
+                                       pkg_name,
+                                       image_local,
+                                       content_key,
+                                       skip_tests,
+                                       push=pushed)
+
+        # only tested images are reused in later builds
+        tested = not skip_tests
+        _built_images[content_key] = (image_local, tested)
+
+        if tested:
+            e.run('docker',
+                  'tag',
+                  image_local,
+                  image_content,
+                  description='Tagging')
 
     if until == 'build':
         raise CommanderStop('Done. Run "docker images" to see your image.')
@@ -115,12 +187,18 @@ def build(e, cfg, name, until, skip_tests=False):
     # TODO: validate format of cfg.repository
     if cfg.repository:
         image_target = f'{cfg.repository}:{version}'
-        e.run('docker',
-              'tag',
-              image_local,
-              image_target,
-              description='Tagging')
-        e.run('docker', 'push', image_target, description='Pushing image')
+
+        with tracing.span('push image'):
+            remotes = [image_target] + ([remote_content] if tested else [])
+            _push(e,
+                  image_local,
+                  [remote for remote in remotes if remote not in pushed])
+
+            if deps_to_push:
+                e.run('docker',
+                      'push',
+                      deps_to_push,
+                      description='Pushing dependencies image')
     else:
         image_target = image_local
 
@@ -128,3 +206,586 @@ def build(e, cfg, name, until, skip_tests=False):
         raise CommanderStop('Done. Image pushed to repository.')
 
     return pkg_name, image_target
+
+
+def _build_and_test(e,
+                    cfg,
+                    pkg_name,
+                    image_local,
+                    content_key,
+                    skip_tests,
+                    push=None):
+    """
+    Builds the image and tests it. Returns the name of the dependencies
+    image if it was built (to push it), None otherwise. With buildx, the
+    image is also pushed with the names in push in the same build
+    """
+    build_args = ['--label', f'soopervisor.content-key={content_key}']
+    deps_to_push = None
+    # Dockerfiles with cache mounts only build with BuildKit
+    # (buildx shares the cache with BuildKit builds)
+    # with deps_image, BuildKit skips the (unused) deps stage, the legacy
+    # builder would build it again
+    buildkit = (cfg.buildkit or cfg.buildx or cfg.deps_image
+                or '--mount=type=cache' in Path('Dockerfile').read_text())
+
+    with _buildkit(enabled=buildkit):
+        if cfg.deps_image:
+            with tracing.span('dependencies image'):
+                deps_image, deps_built = _deps_image(e, cfg, pkg_name)
+
+            if deps_built:
+                deps_to_push = deps_image
+
+            # start from the dependencies image instead of the deps stage
+            build_args.extend(['--build-arg', f'DEPS_IMAGE={deps_image}'])
+
+        if cfg.buildx:
+            # build once: load the image to test it and (if any) upload the
+            # layers in parallel
+            build = ['docker', 'buildx', 'build', '.', '--load']
+
+            for remote in push or []:
+                build_args.extend(['--tag', remote])
+
+            if push:
+                build_args.append('--push')
+        else:
+            build = ['docker', 'build', '.']
+
+        # how to allow passing --no-cache?
+        with tracing.span('docker build'):
+            e.run(*build,
+                  '--tag',
+                  image_local,
+                  *build_args,
+                  description='Building image')
+
+    if not skip_tests:
+        with tracing.span('test image'):
+            _test_image_once(e, image_local)
+
+    return deps_to_push
+
+
+def _push(e, image, remotes):
+    """
+    Pushes the image with the remote names, skips the ones that already
+    point to the same image in the registry
+    """
+    image_id = _image_id(image)
+    outdated = []
+
+    for remote in remotes:
+        if image_id is not None and image_id == _remote_image_id(remote):
+            e.info(f'Image {remote} is up to date, skipping push')
+        else:
+            outdated.append(remote)
+
+    for remote in outdated:
+        e.run('docker', 'tag', image, remote, description='Tagging')
+        e.run('docker', 'push', remote, description='Pushing image')
+
+
+def _check_script():
+    """Returns the source code of the script that checks the image
+    """
+    return pkg_resources.read_text(assets, 'check_image.py')
+
+
+def _test_image(e, image):
+    """
+    Runs all the checks (e.g., "ploomber status", the File client is
+    configured) in a single container, raises an error if any fails
+    """
+    hint = (f'Use "docker run -it {image} /bin/bash" to start an '
+            'interactive session to debug your image')
+    output = e.run('docker',
+                   'run',
+                   '--rm',
+                   image,
+                   'python',
+                   '-c',
+                   _check_script(),
+                   description='Testing image',
+                   error_message='Error while testing your docker image',
+                   hint=hint,
+                   capture_output=True,
+                   show_cmd=False)
+
+    # the script prints the results in the last line
+    checks = json.loads(output.strip().splitlines()[-1])['checks']
+    failed = [check for check in checks if not check['passed']]
+
+    if failed:
+        errors = '\n'.join(f'* {check["name"]}: {check["error"]}'
+                           for check in failed)
+        raise ClickException(f'Error while testing your docker image. '
+                             f'Failed checks:\n{errors}\n{hint}')
+
+    return checks
+
+
+def _test_image_once(e, image):
+    """
+    Tests the image unless an image with the same ID passed the same version
+    of the checks before. Successful runs are recorded in a local ledger
+    (use --retest to clear it)
+    """
+    image_id = _image_id(image)
+    path = cache.path_to_cache('tested-images.json')
+    ledger = cache.load(path) or {}
+    key = f'{image_id}:{cache.hash_object(_check_script())[:16]}'
+
+    if image_id is not None and key in ledger:
+        e.info(f'Image {image} ({image_id[:19]}) already passed the tests, '
+               'skipping them. Pass --retest to run them again')
+        return
+
+    _test_image(e, image)
+
+    if image_id is not None:
+        ledger[key] = image
+        # dictionaries keep insertion order, drop the oldest entries
+        ledger = dict(list(ledger.items())[-_TESTED_IMAGES_TO_KEEP:])
+        cache.store(path, ledger)
+
+
+def _lock_file():
+    return ('environment.lock.yml' if Path('environment.lock.yml').exists()
+            else 'requirements.lock.txt')
+
+
+def _exists_in_registry(image):
+    """Returns True if the image exists in the registry
+    """
+    try:
+        res = subprocess.run(['docker', 'manifest', 'inspect', image],
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return False
+
+    return not res.returncode
+
+
+def _remote_image_id(image):
+    """
+    Returns the ID of an image in the registry (the digest of its config),
+    None if it does not exist
+    """
+    try:
+        res = subprocess.run(['docker', 'manifest', 'inspect', image],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return None
+
+    if res.returncode:
+        return None
+
+    # manifest lists (multi-platform images) have no config
+    return json.loads(res.stdout).get('config', {}).get('digest')
+
+
+@contextmanager
+def _buildkit(enabled):
+    """Sets DOCKER_BUILDKIT=1 while the context is active (if enabled)
+    """
+    if not enabled:
+        yield
+        return
+
+    previous = os.environ.get('DOCKER_BUILDKIT')
+    os.environ['DOCKER_BUILDKIT'] = '1'
+
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ['DOCKER_BUILDKIT']
+        else:
+            os.environ['DOCKER_BUILDKIT'] = previous
+
+
+def _image_exists(image):
+    """Returns True if the image exists locally
+    """
+    try:
+        res = subprocess.run(['docker', 'image', 'inspect', image],
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return False
+
+    return not res.returncode
+
+
+def _image_id(image):
+    """Returns the ID of a local image, None if it does not exist
+    """
+    try:
+        res = subprocess.run(
+            ['docker', 'image', 'inspect', '--format', '{{.Id}}', image],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return None
+
+    return None if res.returncode else res.stdout.decode().strip()
+
+
+def _pull(image):
+    """Pulls an image, returns True if successful
+    """
+    try:
+        res = subprocess.run(['docker', 'pull', image],
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return False
+
+    return not res.returncode
+
+
+def _deps_image(e, cfg, pkg_name):
+    """
+    Ensures there is an image with the dependencies (the "deps" stage in the
+    Dockerfile), tagged with a hash of the lock file. Uses the local image if
+    it exists, otherwise tries to pull it from the repository, and builds it
+    as a last resort. Returns the image name and whether it was built
+    """
+    dockerfile = Path('Dockerfile').read_text()
+    deps_stage = _deps_stage(dockerfile)
+
+    if deps_stage is None or not _DEPS_IMAGE_ARG.search(dockerfile):
+        raise ClickException(
+            'deps_image requires a Dockerfile with a "deps" stage and a '
+            'DEPS_IMAGE argument to start the next stage from it. '
+            'Delete the Dockerfile and run "soopervisor add" again to '
+            'generate one')
+
+    digest = cache.hash_object([cache.hash_file(_lock_file()),
+                                deps_stage])[:12]
+    image = f'{cfg.repository or pkg_name}-deps:{digest}'
+
+    if _image_exists(image):
+        e.info(f'Using dependencies image {image}')
+        return image, False
+
+    if cfg.repository and _pull(image):
+        e.info(f'Pulled dependencies image {image}')
+        return image, False
+
+    e.run('docker',
+          'build',
+          '.',
+          '--target',
+          'deps',
+          '--tag',
+          image,
+          description='Building dependencies image')
+
+    return image, True
+
+
+def _deps_stage(dockerfile):
+    """
+    Returns the "deps" stage in the Dockerfile (from its FROM line to the
+    next one), None if there isn't one
+    """
+    match = _DEPS_STAGE.search(dockerfile)
+    return None if match is None else match.group(0)
+
+
+def _package(e, cfg, pkg_name):
+    """
+    Packages the project in dist/. The archive is cached, keyed by the files
+    to package and their contents, and reused if nothing changed
+    """
+    setup_py = Path('setup.py').exists()
+
+    if setup_py:
+        files = _sdist_files()
+    else:
+        files = source.select(e,
+                              '.',
+                              include=cfg.include,
+                              exclude=cfg.exclude,
+                              dst='dist')
+
+    compression = cfg.compression.value
+    key = cache.hash_object(
+        dict(files=cache.fingerprint(files),
+             setup_py=setup_py,
+             pkg_name=pkg_name,
+             compression=[compression, cfg.compression_level],
+             wheel=setup_py and cfg.wheel,
+             version=_git_version() if setup_py else None,
+             soopervisor=__version__))
+    cached = cache.path_to_cache('package', key)
+
+    e.rm('dist')
+
+    if cached.is_dir():
+        e.info('Packaged code did not change, reusing it')
+        shutil.copytree(cached, 'dist')
+        # mark as recently used
+        os.utime(cached)
+        return key, _package_sizes(files, setup_py)
+
+    if setup_py:
+        # .egg-info may cause issues if MANIFEST.in was recently updated
+        e.rm('build', Path('src', pkg_name, f'{pkg_name}.egg-info'))
+        args = ['python', '-m', 'build', '--sdist']
+
+        # the source distribution is still needed for the files at the root
+        if cfg.wheel:
+            args.append('--wheel')
+
+        if not cfg.build_isolation:
+            args.append('--no-isolation')
+
+        e.run(*args, description='Packaging code')
+
+        # raise error if include is not None? and suggest to use
+        # MANIFEST.in instead
+    else:
+        e.info('Packaging code')
+        extension = '.tar' if compression == 'none' else '.tar.gz'
+        source.archive(files,
+                       dst=Path('dist', f'{pkg_name}{extension}'),
+                       arcname=pkg_name,
+                       compression=compression,
+                       level=cfg.compression_level)
+
+    if Path('dist').is_dir():
+        shutil.copytree('dist', cached)
+
+    cache.evict('package', keep=_PACKAGES_TO_KEEP)
+
+    return key, _package_sizes(files, setup_py)
+
+
+def _sdist_files():
+    """
+    Returns the files that may end up in the source distribution. Its
+    contents are defined by setup.py and MANIFEST.in, so this takes every
+    file not ignored by git, plus the ignored ones in src/ (e.g., generated
+    package data) or matching MANIFEST.in, except for the ones that
+    soopervisor and the build generate (like select does)
+    """
+    exclude_dirs = ['.soopervisor', 'dist', 'build', *_target_dirs()]
+    files = set(source.list_files('.', exclude_dirs=exclude_dirs))
+
+    if Path('src').is_dir():
+        files.update(source.list_files('src', ignored=True))
+
+    files.update(source.manifest_files(exclude_dirs=exclude_dirs))
+
+    return sorted(files)
+
+
+def _git_version():
+    """
+    Returns the latest tag, number of commits since it and current commit
+    (tools like setuptools_scm take the package version from them), None
+    if git is not available
+    """
+    try:
+        res = subprocess.run(
+            ['git', 'describe', '--tags', '--long', '--always', '--dirty'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        return None
+
+    return None if res.returncode else res.stdout.decode().strip()
+
+
+def _target_dirs():
+    """Returns the directories of the targets in soopervisor.yaml
+    """
+    path = Path('soopervisor.yaml')
+
+    if not path.is_file():
+        return []
+
+    cfg = yaml.safe_load(path.read_text())
+    return list(cfg) if isinstance(cfg, Mapping) else []
+
+
+def _package_sizes(files, setup_py):
+    """
+    Returns the size of each packaged file, read from the source
+    distribution in dist/ if setup_py is True
+    """
+    if not setup_py:
+        return {f: os.path.getsize(f) for f in files}
+
+    sizes = {}
+
+    for path in Path('dist').glob('*.tar.gz'):
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if member.isfile():
+                    # remove the top-level directory ({name}-{version}/)
+                    name = member.name.partition('/')[2]
+                    sizes[name] = member.size
+
+    return sizes
+
+
+def _check_package_size(e, cfg, sizes):
+    """
+    Prints a size report of the packaged files, raises an error if the total
+    exceeds max_package_size
+    """
+    e.print(source.size_report(sizes))
+    total = sum(sizes.values())
+
+    if cfg.max_package_size is not None and total > cfg.max_package_size:
+        raise ClickException(
+            f'Packaged code ({source.format_size(total)}) exceeds '
+            f'max_package_size ({source.format_size(cfg.max_package_size)}).'
+            ' Check the largest files in the report above and exclude '
+            'them (e.g., add them to .gitignore or to \'exclude\' in '
+            'soopervisor.yaml)')
+
+
+def write_dockerignore(path):
+    """
+    Writes a .dockerignore file in path that leaves out everything but the
+    files that the Dockerfile in path copies. An existing file is only
+    updated if it was generated by soopervisor
+    """
+    sources = _copied_files(Path(path, 'Dockerfile'))
+    path = Path(path, '.dockerignore')
+
+    if path.exists() and not path.read_text().startswith(
+            _DOCKERIGNORE_HEADER):
+        return
+
+    if sources is None:
+        content = ('# The Dockerfile may copy any file, the whole directory '
+                   'is sent to Docker\n')
+    else:
+        content = ('# Only the files copied in the Dockerfile are sent to '
+                   'Docker\n*\n')
+        content += ''.join(f'!{file}\n' for file in sources)
+
+    path.write_text(f'{_DOCKERIGNORE_HEADER}\n{content}')
+
+
+def _copied_files(dockerfile):
+    """
+    Returns the sources of the COPY and ADD instructions in the Dockerfile
+    (except the ones copying from another stage or image), None if the
+    Dockerfile does not exist or any source can't be determined (e.g., it
+    copies the whole directory or uses a variable)
+    """
+    if not dockerfile.exists():
+        return None
+
+    # join lines ending with a backslash and drop comments
+    lines = [
+        line for line in dockerfile.read_text().splitlines()
+        if not line.strip().startswith('#')
+    ]
+    instructions = '\n'.join(lines).replace('\\\n', ' ').splitlines()
+
+    sources = []
+
+    for instruction in instructions:
+        instruction, _, args = instruction.strip().partition(' ')
+
+        if instruction.upper() not in {'COPY', 'ADD'}:
+            continue
+
+        args = args.strip()
+        flags = []
+
+        while args.startswith('--'):
+            flag, _, args = args.partition(' ')
+            flags.append(flag)
+            args = args.strip()
+
+        if any(flag.startswith('--from') for flag in flags):
+            continue
+
+        if args.startswith('['):
+            try:
+                args = json.loads(args)
+            except ValueError:
+                return None
+        else:
+            args = args.split()
+
+        for file in args[:-1]:
+            # ADD downloads URLs, they aren't in the build context
+            if '://' in file:
+                continue
+
+            if '$' in file:
+                return None
+
+            file = file.lstrip('/')
+
+            while file.startswith('./'):
+                file = file[2:]
+
+            if file in {'', '.', '*'}:
+                return None
+
+            if file not in sources:
+                sources.append(file)
+
+    return sources
+
+
+def _read_dockerignore(path):
+    """
+    Returns a list of (exception, matcher) tuples with the rules in the
+    .dockerignore file in path
+    """
+    path = Path(path, '.dockerignore')
+
+    if not path.exists():
+        return []
+
+    rules = []
+
+    for line in path.read_text().splitlines():
+        line = line.strip()
+
+        if line and not line.startswith('#'):
+            exception = line.startswith('!')
+            rules.append((exception, PathMatcher([line.lstrip('!')])))
+
+    return rules
+
+
+def context_size(path):
+    """
+    Returns the total size (in bytes) and number of files that
+    "docker build path" sends to the Docker daemon
+    """
+    rules = _read_dockerignore(path)
+    size, n_files = 0, 0
+
+    for root, _, files in os.walk(path):
+        for name in files:
+            file = os.path.join(root, name)
+            rel = os.path.relpath(file, path)
+            ignored = False
+
+            # like docker, the last matching rule wins
+            for exception, matches in rules:
+                if matches(rel):
+                    ignored = not exception
+
+            if not ignored:
+                size += os.path.getsize(file)
+                n_files += 1
+
+    return size, n_files
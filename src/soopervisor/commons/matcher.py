@@ -0,0 +1,133 @@
+"""
+Matching of paths against the include/exclude patterns in soopervisor.yaml
+"""
+import os
+import re
+
+# characters with a special meaning in patterns
+_SPECIAL = set('*?[')
+
+
+def normalize(path):
+    """Returns a normalized, relative, slash-separated path
+    """
+    path = os.path.normpath(path).replace(os.sep, '/')
+    return path.lstrip('/')
+
+
+def _translate(pattern):
+    """Translates a pattern into a regular expression
+    """
+    i, n = 0, len(pattern)
+    out = []
+
+    while i < n:
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            chars = pattern[i + 1:end]
+
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+
+            out.append('[' + chars.replace('\\', '\\\\') + ']')
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+
+    return ''.join(out)
+
+
+class PathMatcher:
+    """
+    Matches paths against .dockerignore-style patterns, relative to the
+    project's root: ``*`` and ``?`` match within a path component and ``**``
+    matches any number of directories. A pattern matching a directory matches
+    everything in it. All patterns are compiled into a single regular
+    expression
+
+    Examples
+    --------
+    >>> from soopervisor.commons.matcher import PathMatcher
+    >>> matcher = PathMatcher(['data', '**/*.csv'])
+    >>> matcher('data/raw/file.parquet'), matcher('sub/file.csv')
+    (True, True)
+    """
+    def __init__(self, patterns):
+        self.patterns = [normalize(p) for p in patterns or []]
+        self._literals = set()
+        anywhere, anchored = [], []
+
+        # plain paths are looked up in a set. Patterns matching a single
+        # component at any level (e.g., **/*.csv) are searched for, the
+        # rest must match from the root. Python's regular expressions
+        # backtrack a lot on leading wildcards, so avoid them when possible
+        for pattern in self.patterns:
+            rest = pattern[3:]
+
+            if not _SPECIAL & set(pattern):
+                self._literals.add(pattern)
+            elif pattern.startswith('**/') and '/' not in rest:
+                if rest.startswith('*'):
+                    anywhere.append(_translate(rest[1:]))
+                else:
+                    anywhere.append('(?:^|/)' + _translate(rest))
+            else:
+                anchored.append(_translate(pattern))
+
+        self._search = (re.compile('(?:{})(?:/|$)'.format('|'.join(anywhere)))
+                        if anywhere else None)
+        self._regex = (re.compile('(?:{})(?:/.*)?'.format('|'.join(anchored)))
+                       if anchored else None)
+
+    def __call__(self, path):
+        path = normalize(path)
+
+        if self._literals:
+            prefix = path
+
+            while prefix:
+                if prefix in self._literals:
+                    return True
+
+                prefix = prefix.rpartition('/')[0]
+
+        return ((self._search is not None
+                 and self._search.search(path) is not None)
+                or (self._regex is not None
+                    and self._regex.fullmatch(path) is not None))
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def base_dirs(self):
+        """
+        Returns the paths where the matching files may be: the leading
+        components of each pattern without special characters
+        """
+        bases = set()
+
+        for pattern in self.patterns:
+            parts = []
+
+            for part in pattern.split('/'):
+                if _SPECIAL & set(part):
+                    break
+
+                parts.append(part)
+
+            bases.add('/'.join(parts) or '.')
+
+        return bases
@@ -1,80 +1,196 @@
+import io
+import gzip
 import tarfile
 import os.path
-import shutil
 from pathlib import Path
-from itertools import chain
-from glob import iglob
 import subprocess
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 from click.exceptions import ClickException
 
+from soopervisor import tracing
+from soopervisor.commons.matcher import PathMatcher
 
-def git_tracked_files():
-    res = subprocess.run(['git', 'ls-tree', '-r', 'HEAD', '--name-only'],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
 
-    if not res.returncode:
-        return res.stdout.decode().splitlines(), None
-    else:
-        return None, res.stderr.decode().strip()
+def git_files(path='.'):
+    """
+    Lists the files in path with a single git call. Returns a
+    (tracked, untracked, error) tuple, where tracked has the files in the git
+    index and untracked the new files (ignored files are in neither)
+    """
+    cmd = [
+        'git', 'ls-files', '-z', '-t', '--cached', '--others',
+        '--exclude-standard', '--',
+        str(path)
+    ]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    if res.returncode:
+        return None, None, res.stderr.decode().strip()
+
+    tracked, untracked = set(), set()
+
+    # each entry looks like "H path" ("?" for untracked files)
+    for entry in res.stdout.decode().split('\0'):
+        if entry:
+            tag, f = entry[0], os.path.normpath(entry[2:])
+            (untracked if tag == '?' else tracked).add(f)
 
+    return tracked, untracked, None
 
-def git_is_dirty():
+
+def walk(path, prune=None):
     """
-    Returns True if there are git untracked files (new files that haven't been
-    committed yet)
+    Yields the paths to all files in path in a single pass. Hidden
+    directories (e.g., .git) are never yielded nor traversed (hidden files
+    are). Directories for which prune(dir) returns True are skipped without
+    descending into them
     """
-    res = subprocess.run(['git', 'status', '--short'],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
+    root = '' if Path(path) == Path('.') else str(path)
+    pending = [root]
 
-    return not (res.returncode or '??' not in res.stdout.decode())
+    while pending:
+        current = pending.pop()
 
+        with os.scandir(current or '.') as entries:
+            for entry in entries:
+                child = os.path.join(current, entry.name)
 
-def is_relative_to(path, prefix):
-    if prefix is None:
-        return False
+                if entry.is_dir():
+                    if not (entry.name.startswith('.') or
+                            (prune is not None and prune(child))):
+                        pending.append(child)
+                elif entry.is_file():
+                    yield child
 
-    try:
-        Path(path).relative_to(prefix)
-    except ValueError:
-        return False
-    else:
-        return True
 
+def list_files(src, exclude_dirs=None, ignored=False):
+    """
+    Returns the (sorted) list of files in src that are not ignored by git,
+    all files if git is not available or ignored is True. Files in
+    exclude_dirs, __pycache__ or .egg-info directories are never listed
+    """
+    skip = _skip_dir(exclude_dirs)
+
+    if not ignored:
+        tracked, untracked, error = git_files(src)
+
+        if not error:
+            return sorted(
+                f for f in tracked | untracked
+                if not skip(os.path.dirname(f)) and os.path.isfile(f))
 
-def is_relative_to_any(path, prefixes):
-    return any(is_relative_to(path, prefix) for prefix in prefixes)
+    return sorted(walk(src, prune=skip))
 
 
-def glob_all(path, exclude=None):
-    hidden = iglob(str(Path(path) / '**' / '.*'), recursive=True)
-    normal = iglob(str(Path(path) / '**'), recursive=True)
+def _skip_dir(exclude_dirs):
+    """
+    Returns a function that returns True for directories in exclude_dirs,
+    __pycache__ and .egg-info directories
+    """
+    exclude_dirs = set(os.path.normpath(d) for d in exclude_dirs or [])
+
+    def skip(directory):
+        return (any(part == '__pycache__' or part.endswith('.egg-info')
+                    for part in Path(directory).parts)
+                or _is_in(directory, exclude_dirs))
+
+    return skip
+
+
+def manifest_files(path='MANIFEST.in', exclude_dirs=None):
+    """
+    Returns the files that match the commands in a MANIFEST.in file (even
+    if git ignores them), an empty list if the file does not exist. Files
+    in exclude_dirs, __pycache__ or .egg-info directories are never listed
+    """
+    if not Path(path).is_file():
+        return []
+
+    from setuptools.command.egg_info import FileList
+    from setuptools.errors import TemplateError
 
-    for path in chain(hidden, normal):
-        if Path(path).is_file() and not is_relative_to(path, exclude):
-            yield path
+    file_list = FileList()
 
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
 
-def copy(cmdr, src, dst, include=None, exclude=None):
-    include = set() if include is None else set(include)
-    exclude = set() if exclude is None else set(exclude)
-    exclude_dirs = set(p for p in exclude if Path(p).is_dir())
-    include_dirs = set(p for p in include if Path(p).is_dir())
+        if line and not line.startswith('#'):
+            # invalid lines make the build fail, which reports them
+            try:
+                file_list.process_template_line(line)
+            except TemplateError:
+                pass
 
-    overlap = set(include) & set(exclude)
+    skip = _skip_dir(exclude_dirs)
+
+    return sorted(f for f in file_list.files
+                  if not skip(os.path.dirname(f)) and os.path.isfile(f))
+
+
+def _is_in(path, dirs):
+    """
+    Returns True if path or any of its parents is in dirs (a set of
+    normalized paths)
+    """
+    while path:
+        if path in dirs:
+            return True
+
+        parent = os.path.dirname(path)
+
+        if parent == path:
+            return False
+
+        path = parent
+
+    return False
+
+
+def _in_hidden_dir(path):
+    """Returns True if any of the directories in path is hidden
+    """
+    return any(
+        part.startswith('.') and part not in {'.', '..'}
+        for part in Path(path).parent.parts)
+
+
+def select(cmdr, src, include=None, exclude=None, dst=None):
+    """
+    Returns the (sorted) list of files to package. The candidates come from
+    the git index (tracked files, including staged but not committed ones,
+    plus the ones matching include), if git is not available, src is walked
+    and everything is a candidate. Files in hidden directories (e.g.,
+    .github) are only packaged if they match include. include and exclude
+    are lists of patterns (see matcher.PathMatcher)
+    """
+    include = set() if include is None else set(
+        os.path.normpath(p) for p in include)
+    exclude = set() if exclude is None else set(
+        os.path.normpath(p) for p in exclude)
+
+    overlap = include & exclude
 
     if overlap:
         raise ClickException('include and exclude must not have '
                              f'overlapping elements: {overlap}')
 
-    if git_is_dirty():
-        cmdr.warn_on_exit('Your git repository contains untracked '
-                          'files, which will be ignored when building the '
-                          'Docker image. Commit them if needed.')
+    is_included = PathMatcher(include)
+    is_excluded = PathMatcher(exclude)
+    # never include the soopervisor cache nor the output directory
+    never_include_dirs = {'.soopervisor'}
+
+    if dst is not None:
+        never_include_dirs.add(os.path.normpath(dst))
 
-    tracked, error = git_tracked_files()
+    def prune(directory):
+        return (os.path.basename(directory) == '__pycache__'
+                or _is_in(directory, never_include_dirs)
+                or is_excluded(directory))
+
+    tracked, untracked, error = git_files(src)
 
     if error:
         cmdr.warn_on_exit(
@@ -82,23 +198,220 @@ def copy(cmdr, src, dst, include=None, exclude=None):
             'will be included, except for files in the \'exclude\' section '
             'of soopervisor.yaml')
 
-    for f in glob_all(path=src, exclude=dst):
+        candidates = set(walk(src, prune=prune))
+    else:
+        if any(not _is_in(f, never_include_dirs) for f in untracked):
+            cmdr.warn_on_exit('Your git repository contains untracked '
+                              'files, which will be ignored when building '
+                              'the Docker image. Commit them if needed.')
+
+        # like walk, skip hidden directories
+        candidates = set(f for f in tracked if not _in_hidden_dir(f))
+
+        # look for included files (which may be ignored by git) only where
+        # the patterns may match
+        for base in is_included.base_dirs():
+            if os.path.isfile(base):
+                candidates.add(base)
+            elif os.path.isdir(base):
+                candidates.update(walk(base, prune=prune))
+
+    selected = []
+
+    for f in candidates:
         tracked_by_git = tracked is None or f in tracked
-        excluded = f in exclude or is_relative_to_any(f, exclude_dirs)
-        included = f in include or is_relative_to_any(f, include_dirs)
-        # never include .git or .gitignore
-        never_include = Path(f).name.startswith('.git') or '__pycache__' in f
+        # never include .git, .gitignore or __pycache__
+        never_include = (os.path.basename(f).startswith('.git')
+                         or '__pycache__' in f
+                         or _is_in(f, never_include_dirs))
 
-        if ((tracked_by_git or included) and not excluded
-                and not never_include):
-            target = Path(dst, f)
-            target.parent.mkdir(exist_ok=True, parents=True)
-            shutil.copy(f, dst=target)
-            print(f'Copying {f} -> {target}')
+        if ((tracked_by_git or is_included(f)) and not never_include
+                and not is_excluded(f) and os.path.isfile(f)):
+            selected.append(f)
 
+    return sorted(selected)
 
-def compress_dir(src, dst):
-    with tarfile.open(dst, "w:gz") as tar:
-        tar.add(src, arcname=os.path.basename(src))
 
-    shutil.rmtree(src)
+def format_size(size):
+    """Returns a human-readable size (e.g., 1.5 MB)
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            break
+
+        size /= 1024
+
+    return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+
+
+def size_report(sizes, top=10):
+    """
+    Returns a report with the total size, the largest files and the size
+    of each top-level directory
+
+    Parameters
+    ----------
+    sizes : dict
+        Maps paths to their size in bytes
+
+    top : int, default=10
+        How many files and directories to show
+    """
+    by_dir = {}
+
+    for path, size in sizes.items():
+        parts = path.replace(os.sep, '/').split('/')
+        dir_ = parts[0] + '/' if len(parts) > 1 else '(root)'
+        by_dir[dir_] = by_dir.get(dir_, 0) + size
+
+    def table(items):
+        largest = sorted(items, key=lambda item: item[1], reverse=True)
+        return [
+            f'  {format_size(size):>10}  {path}'
+            for path, size in largest[:top]
+        ]
+
+    lines = [
+        f'Package size: {format_size(sum(sizes.values()))} '
+        f'({len(sizes)} files)', 'Largest files:'
+    ]
+    lines.extend(table(sizes.items()))
+    lines.append('Size by directory:')
+    lines.extend(table(by_dir.items()))
+
+    return '\n'.join(lines)
+
+
+def _normalize(tarinfo):
+    """
+    Drops the metadata that changes between exports (timestamps, owner and
+    permissions other than the executable bit) so archives are reproducible
+    """
+    tarinfo.mtime = 0
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ''
+
+    if tarinfo.isdir() or tarinfo.mode & 0o100:
+        tarinfo.mode = 0o755
+    else:
+        tarinfo.mode = 0o644
+
+    return tarinfo
+
+
+def _compress_block(block, level):
+    """
+    Returns a gzip member with the block (no timestamp in the header).
+    gzip.compress only accepts mtime in Python 3.8+
+    """
+    out = io.BytesIO()
+
+    with gzip.GzipFile(filename='',
+                       mode='wb',
+                       fileobj=out,
+                       mtime=0,
+                       compresslevel=level) as gz:
+        gz.write(block)
+
+    return out.getvalue()
+
+
+class _ParallelGzipWriter:
+    """
+    Write-only file object that compresses fixed-size blocks in a thread pool
+    (zlib releases the GIL). Each block is written as a separate gzip member,
+    gzip (and tar -z) read consecutive members as a single stream
+    """
+    def __init__(self, fileobj, level, block_size=4 * 1024 * 1024):
+        self._fileobj = fileobj
+        self._level = level
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._written = 0
+        self._max_workers = os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        self._pending = deque()
+
+    def write(self, data):
+        self._buffer += data
+        self._written += len(data)
+
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def _submit(self, block):
+        self._pending.append(
+            self._executor.submit(_compress_block, block, self._level))
+
+        # limit the number of compressed blocks held in memory
+        while len(self._pending) > 2 * self._max_workers:
+            self._fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+
+            while self._pending:
+                self._fileobj.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
+
+
+@contextmanager
+def _open_archive(dst, compression='gz', level=6):
+    """
+    Opens a tar file for writing, compressed with gzip ('gz'), gzip using all
+    CPUs ('parallel-gz'), or uncompressed ('none'). gzip headers have no
+    timestamp nor file name. Symlinks are stored as the files they point to
+    """
+    with open(dst, 'wb') as f:
+        if compression == 'none':
+            with tarfile.open(fileobj=f, mode='w', dereference=True) as tar:
+                yield tar
+        elif compression == 'parallel-gz':
+            writer = _ParallelGzipWriter(f, level=level)
+
+            try:
+                with tarfile.open(fileobj=writer,
+                                  mode='w',
+                                  dereference=True) as tar:
+                    yield tar
+            finally:
+                writer.close()
+        elif compression == 'gz':
+            with gzip.GzipFile(filename='',
+                               mode='wb',
+                               fileobj=f,
+                               mtime=0,
+                               compresslevel=level) as gz:
+                with tarfile.open(fileobj=gz,
+                                  mode='w',
+                                  dereference=True) as tar:
+                    yield tar
+        else:
+            raise ValueError(f'Invalid compression: {compression!r}')
+
+
+def archive(files, dst, arcname, compression='gz', level=6):
+    """
+    Adds files to a dst tar file, under an arcname directory. See
+    _open_archive for the compression options
+    """
+    Path(dst).parent.mkdir(parents=True, exist_ok=True)
+
+    with tracing.span('compress'), _open_archive(dst, compression,
+                                                 level) as tar:
+        for f in files:
+            tar.add(f,
+                    arcname=os.path.join(arcname, f),
+                    recursive=False,
+                    filter=_normalize)
+            print(f'Adding {f} -> {dst}')
@@ -32,3 +32,14 @@ class Mode(Enum, metaclass=CustomEnum):
     @classmethod
     def get_values(cls):
         return [v.value for v in cls.__members__.values()]
+
+
+@unique
+class Compression(Enum, metaclass=CustomEnum):
+    none = 'none'
+    gz = 'gz'
+    parallel_gz = 'parallel-gz'
+
+    @classmethod
+    def get_values(cls):
+        return [v.value for v in cls.__members__.values()]
@@ -1,19 +1,23 @@
+"""
+Exporters are imported lazily so only the selected backend's dependencies
+are loaded
+"""
+import importlib
+
 from soopervisor.enum import Backend
-from soopervisor.aws.batch import AWSBatchExporter
-from soopervisor.aws.lambda_ import AWSLambdaExporter
-from soopervisor.airflow.export import AirflowExporter
-from soopervisor.argo.export import ArgoWorkflowsExporter
 
+_EXPORTERS = {
+    Backend.aws_batch: 'soopervisor.aws.batch.AWSBatchExporter',
+    Backend.aws_lambda: 'soopervisor.aws.lambda_.AWSLambdaExporter',
+    Backend.airflow: 'soopervisor.airflow.export.AirflowExporter',
+    Backend.argo_workflows: 'soopervisor.argo.export.ArgoWorkflowsExporter',
+}
 
-def for_backend(backend):
-    mapping = {
-        Backend.aws_batch: AWSBatchExporter,
-        Backend.aws_lambda: AWSLambdaExporter,
-        Backend.airflow: AirflowExporter,
-        Backend.argo_workflows: ArgoWorkflowsExporter,
-    }
 
+def for_backend(backend):
     if backend not in Backend:
         raise ValueError(f'{backend!r} is not a valid backend')
 
-    return mapping[backend]
+    module_name, _, class_name = _EXPORTERS[Backend(backend)].rpartition('.')
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
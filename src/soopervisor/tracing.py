@@ -0,0 +1,126 @@
+"""
+Wall-clock tracing of the add/export phases. Spans are recorded only while
+a record() context is active, otherwise span() does nothing
+
+Examples
+--------
+>>> from soopervisor import tracing
+>>> with tracing.record('profile.json'):
+...     with tracing.span('docker build'):
+...         pass
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+import click
+
+_recorder = None
+
+
+class _Recorder:
+    def __init__(self):
+        self.spans = []
+        self._depth = 0
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        depth = self._depth
+        self._depth += 1
+
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.spans.append(
+                dict(name=name,
+                     start=start - self._origin,
+                     end=time.perf_counter() - self._origin,
+                     depth=depth,
+                     tid=threading.get_ident()))
+
+    def to_chrome_trace(self):
+        """
+        Returns the spans in the Chrome trace format (can be opened in
+        chrome://tracing or https://ui.perfetto.dev)
+        """
+        pid = os.getpid()
+        events = [
+            dict(name=span['name'],
+                 cat='soopervisor',
+                 ph='X',
+                 ts=span['start'] * 1e6,
+                 dur=(span['end'] - span['start']) * 1e6,
+                 pid=pid,
+                 tid=span['tid'])
+            for span in sorted(self.spans, key=lambda s: s['start'])
+        ]
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def summary(self):
+        """Returns a table with the duration of each span (in start order)
+        """
+        spans = sorted(self.spans, key=lambda s: s['start'])
+        width = max([len('  ' * s['depth'] + s['name'])
+                     for s in spans] + [len('Phase')])
+        lines = [f'{"Phase":<{width}}  Time (s)', '-' * (width + 10)]
+
+        for span in spans:
+            name = '  ' * span['depth'] + span['name']
+            duration = span['end'] - span['start']
+            lines.append(f'{name:<{width}}  {duration:8.2f}')
+
+        return '\n'.join(lines)
+
+
+@contextmanager
+def span(name):
+    """Records the wall-clock time spent in the block (if recording)
+    """
+    if _recorder is None:
+        yield
+    else:
+        with _recorder.span(name):
+            yield
+
+
+@contextmanager
+def record(path, enabled=True):
+    """
+    Records all spans while the context is active, then saves them in
+    the Chrome trace format and prints a summary
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Where to save the trace
+
+    enabled : bool, default=True
+        If False, nothing is recorded
+    """
+    global _recorder
+
+    if not enabled:
+        yield
+        return
+
+    # commands may change the working directory
+    path = Path(path).resolve()
+    _recorder = recorder = _Recorder()
+
+    try:
+        yield recorder
+    finally:
+        _recorder = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(recorder.to_chrome_trace()))
+
+        click.echo(recorder.summary())
+        click.echo(f'Trace saved to {str(path)!r}. Open it with '
+                   'https://ui.perfetto.dev or chrome://tracing')
@@ -26,6 +26,13 @@ def test(c):
     c.run('pytest tests', pty=True)
 
 
+@task
+def benchmark(c):
+    """Run the micro-benchmarks (they report timings, nothing is asserted)
+    """
+    c.run('python benchmarks/path_matcher.py', pty=True)
+
+
 @task
 def doc(c, open_=True):
     with c.cd('doc'):
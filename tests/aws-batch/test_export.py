@@ -12,6 +12,9 @@ from soopervisor.aws import batch
 from soopervisor.aws.batch import commons
 from ploomber.io import _commander, _commander_tester
 from ploomber.util import util
+from soopervisor.commons import docker
+
+CHECKS_PASSED = b'{"checks": [{"name": "status", "passed": true}]}\n'
 
 service_role = {
     "Version":
@@ -226,15 +229,15 @@ def index_commands_by_name(submitted):
 
 @pytest.fixture
 def monkeypatch_docker(monkeypatch):
-    cmd = ('from ploomber.spec import '
-           'DAGSpec; print("File" in DAGSpec.find().to_dag().clients)')
+    cmd = docker._check_script()
     tester = _commander_tester.CommanderTester(
         run=[
             ('python', '-m', 'build', '--sdist'),
         ],
         return_value={
-            ('docker', 'run', 'my_project:0.1dev', 'python', '-c', cmd):
-            b'True\n'
+            ('docker', 'run', '--rm', 'my_project:0.1dev', 'python', '-c',
+             cmd):
+            CHECKS_PASSED
         })
 
     subprocess_mock = Mock()
@@ -274,7 +277,8 @@ def test_export(mock_batch, monkeypatch_docker, monkeypatch,
 
     load_tasks_mock.assert_called_once_with(cmdr=commander_mock.__enter__(),
                                             name='train',
-                                            mode=mode)
+                                            mode=mode,
+                                            session=exporter._session)
 
     submitted = index_submit_job_by_task_name(
         boto3_mock.submit_job.call_args_list)
@@ -349,4 +353,4 @@ def test_dockerfile_when_no_setup_py(mock_batch, monkeypatch_docker,
     exporter.add()
 
     dockerfile = Path('train', 'Dockerfile').read_text()
-    assert 'RUN pip install *.tar.gz --no-deps' not in dockerfile
+    assert 'pip install' not in dockerfile
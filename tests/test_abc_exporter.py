@@ -1,11 +1,14 @@
 import os
 from pathlib import Path
+from unittest.mock import Mock
 
 import pytest
+from ploomber import DAG
 from ploomber.exceptions import DAGSpecInvalidError
 from click import ClickException
 
 from soopervisor.abc import AbstractExporter, AbstractConfig
+from soopervisor import commons
 
 
 class ConcreteConfig(AbstractConfig):
@@ -20,15 +23,15 @@ class ConcreteExporter(AbstractExporter):
     CONFIG_CLASS = ConcreteConfig
 
     @staticmethod
-    def _add():
+    def _add(cfg, env_name, session):
         pass
 
     @staticmethod
-    def _export():
+    def _export(cfg, env_name, mode, until, skip_tests, session):
         pass
 
     @staticmethod
-    def _validate(cfg, dag, env_name):
+    def _validate(cfg, session, env_name):
         pass
 
 
@@ -58,4 +61,35 @@ def test_initializes_pipeline_with_name_if_exists(tmp_sample_project):
     assert ConcreteExporter('soopervisor.yaml', env_name='serve')
 
 
+def test_renders_dag_once(tmp_sample_project, monkeypatch):
+    calls = []
+    render_original = DAG.render
+
+    def render(self, *args, **kwargs):
+        calls.append(self)
+        return render_original(self, *args, **kwargs)
+
+    monkeypatch.setattr(DAG, 'render', render)
+
+    exporter = ConcreteExporter('soopervisor.yaml', env_name='some_env')
+    tasks, _ = commons.load_tasks(cmdr=Mock(),
+                                  name='some_env',
+                                  mode='regular',
+                                  session=exporter._session)
+
+    assert len(calls) == 1
+    assert set(tasks) == {'raw', 'clean', 'plot'}
+
+
 # TODO: submit without adding first
+
+
+@pytest.mark.parametrize('retest', [False, True])
+def test_retest_clears_tested_images(tmp_sample_project, retest):
+    path = commons.cache.path_to_cache('tested-images.json')
+    commons.cache.store(path, {'sha256:abc:checks': 'image:latest'})
+
+    exporter = ConcreteExporter('soopervisor.yaml', env_name='some_env')
+    exporter.export(mode='regular', retest=retest)
+
+    assert path.exists() is not retest
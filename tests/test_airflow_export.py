@@ -10,6 +10,9 @@ from ploomber.io import _commander, _commander_tester
 import pytest
 
 from soopervisor.airflow.export import AirflowExporter, commons
+from soopervisor.commons import docker
+
+CHECKS_PASSED = b'{"checks": [{"name": "status", "passed": true}]}\n'
 
 
 def git_init():
@@ -22,11 +25,11 @@ def git_init():
 
 @pytest.fixture
 def mock_docker_calls(monkeypatch):
-    cmd = ('from ploomber.spec import '
-           'DAGSpec; print("File" in DAGSpec.find().to_dag().clients)')
+    cmd = docker._check_script()
     tester = _commander_tester.CommanderTester(return_value={
-        ('docker', 'run', 'sample_project:latest', 'python', '-c', cmd):
-        b'True\n'
+        ('docker', 'run', '--rm', 'sample_project:latest', 'python', '-c',
+         cmd):
+        CHECKS_PASSED
     })
 
     subprocess_mock = Mock()
@@ -99,7 +102,8 @@ def test_airflow_export_sample_project(monkeypatch, mock_docker_calls,
 
     load_tasks_mock.assert_called_once_with(cmdr=ANY,
                                             name='serve',
-                                            mode='incremental')
+                                            mode='incremental',
+                                            session=ANY)
     assert isinstance(dag, DAG)
     assert set(dag.task_dict) == {'clean', 'plot', 'raw'}
     assert set(type(t) for t in dag.tasks) == {DockerOperator}
@@ -113,11 +117,11 @@ def test_airflow_export_sample_project(monkeypatch, mock_docker_calls,
 
 @pytest.fixture
 def mock_docker_calls_callables(monkeypatch):
-    cmd = ('from ploomber.spec import '
-           'DAGSpec; print("File" in DAGSpec.find().to_dag().clients)')
+    cmd = docker._check_script()
     tester = _commander_tester.CommanderTester(return_value={
-        ('docker', 'run', 'callables:latest', 'python', '-c', cmd):
-        b'True\n'
+        ('docker', 'run', '--rm', 'callables:latest', 'python', '-c',
+         cmd):
+        CHECKS_PASSED
     })
 
     subprocess_mock = Mock()
@@ -210,4 +214,4 @@ def test_dockerfile_when_no_setup_py(tmp_sample_project, no_sys_modules_cache):
     exporter.add()
 
     dockerfile = Path('serve', 'Dockerfile').read_text()
-    assert 'RUN pip install *.tar.gz --no-deps' not in dockerfile
+    assert 'pip install' not in dockerfile
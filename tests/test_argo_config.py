@@ -1,4 +1,5 @@
 from soopervisor.argo.config import ArgoConfig, ArgoMountedVolume
+from soopervisor.enum import Compression
 
 
 def test_make_volume_entries():
@@ -46,4 +47,14 @@ def test_sample_project_from_empty_config(tmp_empty):
         'mounted_volumes': None,
         'include': None,
         'exclude': None,
+        'remote_metadata_workers': 16,
+        'compression': Compression.gz,
+        'compression_level': 6,
+        'max_package_size': None,
+        'build_isolation': True,
+        'wheel': False,
+        'multi_stage': False,
+        'deps_image': False,
+        'buildkit': False,
+        'buildx': False,
     }
@@ -13,19 +13,22 @@ from click.testing import CliRunner
 
 from soopervisor.argo.export import ArgoWorkflowsExporter, commons
 from soopervisor import cli
+from soopervisor.commons import docker
+
+CHECKS_PASSED = b'{"checks": [{"name": "status", "passed": true}]}\n'
 
 
 @pytest.fixture
 def mock_docker_calls(monkeypatch):
-    cmd = ('from ploomber.spec import '
-           'DAGSpec; print("File" in DAGSpec.find().to_dag().clients)')
+    cmd = docker._check_script()
     tester = _commander_tester.CommanderTester(
         run=[
             ('python', '-m', 'build', '--sdist'),
         ],
         return_value={
-            ('docker', 'run', 'my_project:0.1dev', 'python', '-c', cmd):
-            b'True\n'
+            ('docker', 'run', '--rm', 'my_project:0.1dev', 'python', '-c',
+             cmd):
+            CHECKS_PASSED
         })
 
     subprocess_mock = Mock()
@@ -40,6 +43,22 @@ def test_add(tmp_sample_project):
     exporter.add()
 
     assert Path('serve', 'Dockerfile').exists()
+    assert Path('serve', '.dockerignore').read_text().splitlines()[2:] == [
+        '*',
+        '!environment.lock.yml',
+        '!dist/*',
+    ]
+
+
+def test_add_multi_stage_from_config(tmp_sample_project):
+    Path('soopervisor.yaml').write_text('serve:\n'
+                                        '  backend: argo-workflows\n'
+                                        '  multi_stage: true\n')
+    exporter = ArgoWorkflowsExporter(path_to_config='soopervisor.yaml',
+                                     env_name='serve')
+    exporter.add()
+
+    assert 'FROM ubuntu' in Path('serve', 'Dockerfile').read_text()
 
 
 def test_dockerfile_when_no_setup_py(tmp_sample_project):
@@ -48,7 +67,17 @@ def test_dockerfile_when_no_setup_py(tmp_sample_project):
     exporter.add()
 
     dockerfile = Path('serve', 'Dockerfile').read_text()
-    assert 'RUN pip install *.tar.gz --no-deps' not in dockerfile
+    assert 'pip install' not in dockerfile
+
+
+def test_dockerfile_when_setup_py(backup_packaged_project):
+    exporter = ArgoWorkflowsExporter(path_to_config='soopervisor.yaml',
+                                     env_name='serve')
+    exporter.add()
+
+    dockerfile = Path('serve', 'Dockerfile').read_text()
+    assert 'pip install *.whl --no-deps' in dockerfile
+    assert 'pip install *.tar.gz --no-deps' in dockerfile
 
 
 @pytest.mark.parametrize('mode, args', [
@@ -71,7 +100,10 @@ def test_export(mock_docker_calls, backup_packaged_project, monkeypatch, mode,
     spec = yaml.safe_load(yaml_str)
     dag = DAGSpec.find().to_dag()
 
-    load_tasks_mock.assert_called_once_with(cmdr=ANY, name='serve', mode=mode)
+    load_tasks_mock.assert_called_once_with(cmdr=ANY,
+                                            name='serve',
+                                            mode=mode,
+                                            session=ANY)
 
     # make sure the "source" key is represented in literal style
     # (https://yaml-multiline.info/) to make the generated script more readable
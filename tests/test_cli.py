@@ -1,3 +1,7 @@
+import sys
+import json
+import subprocess
+from pathlib import Path
 from unittest.mock import Mock
 
 import pytest
@@ -34,7 +38,9 @@ def test_sample_project_no_args(args, backend, tmp_sample_project,
     exporter_.assert_called_once_with('soopervisor.yaml', env_name='serve')
     exporter_().export.assert_called_once_with(mode='incremental',
                                                until=None,
-                                               skip_tests=False)
+                                               skip_tests=False,
+                                               ignore_cache=False,
+                                               retest=False)
 
 
 @pytest.mark.parametrize('args, backend', [
@@ -68,7 +74,9 @@ def test_sample_project(args, args_export, mode, backend, tmp_sample_project,
     exporter_.assert_called_once_with('soopervisor.yaml', env_name='serve')
     exporter_().export.assert_called_once_with(mode=mode,
                                                until=None,
-                                               skip_tests=False)
+                                               skip_tests=False,
+                                               ignore_cache=False,
+                                               retest=False)
 
 
 @pytest.mark.parametrize('args', [
@@ -109,4 +117,160 @@ def test_skip_tests(args, backend, tmp_sample_project, monkeypatch):
     exporter_.assert_called_once_with('soopervisor.yaml', env_name='serve')
     exporter_().export.assert_called_once_with(mode='incremental',
                                                until=None,
-                                               skip_tests=True)
+                                               skip_tests=True,
+                                               ignore_cache=False,
+                                               retest=False)
+
+
+def test_retest(tmp_sample_project, monkeypatch):
+    runner = CliRunner()
+    result = runner.invoke(cli, ['add', 'serve', '--backend', 'aws-batch'],
+                           catch_exceptions=False)
+    assert result.exit_code == 0
+
+    exporter_ = Mock()
+    monkeypatch.setattr(exporter, 'for_backend', Mock(return_value=exporter_))
+
+    result = runner.invoke(cli, ['export', 'serve', '--retest'],
+                           catch_exceptions=False)
+    assert result.exit_code == 0
+
+    exporter_().export.assert_called_once_with(mode='incremental',
+                                               until=None,
+                                               skip_tests=False,
+                                               ignore_cache=False,
+                                               retest=True)
+
+
+def test_export_many(tmp_sample_project, monkeypatch):
+    runner = CliRunner()
+
+    for name, backend in [('training', 'argo-workflows'),
+                          ('batch-training', 'aws-batch'),
+                          ('scheduled', 'airflow')]:
+        result = runner.invoke(cli, ['add', name, '--backend', backend],
+                               catch_exceptions=False)
+        assert result.exit_code == 0
+
+    exporter_ = Mock()
+    for_backend = Mock(return_value=exporter_)
+    monkeypatch.setattr(exporter, 'for_backend', for_backend)
+
+    result = runner.invoke(
+        cli, ['export', 'training', 'batch-training', 'scheduled', '--retest'],
+        catch_exceptions=False)
+    assert result.exit_code == 0
+
+    assert [c[0][0] for c in for_backend.call_args_list] == [
+        Backend.argo_workflows,
+        Backend.aws_batch,
+        Backend.airflow,
+    ]
+    assert [c[1]['env_name'] for c in exporter_.call_args_list
+            ] == ['training', 'batch-training', 'scheduled']
+    # the tested images are cleared only once
+    assert [c[1]['retest'] for c in exporter_().export.call_args_list
+            ] == [True, False, False]
+
+
+def test_export_requires_a_name(tmp_sample_project):
+    result = CliRunner().invoke(cli, ['export'])
+
+    assert result.exit_code == 2
+    assert "Missing argument 'NAME...'" in result.output
+
+
+@pytest.mark.parametrize('args', [['--help'], ['--version']])
+def test_cli_does_not_import_heavy_modules(args):
+    # run in a subprocess since these modules are already imported here
+    code = f"""
+import sys
+from soopervisor.cli import cli
+
+try:
+    cli({args!r})
+except SystemExit:
+    pass
+
+heavy = ['ploomber', 'pydantic', 'jinja2', 'yaml', 'boto3']
+print(sorted(set(heavy) & set(sys.modules)))
+"""
+    out = subprocess.check_output([sys.executable, '-c', code])
+
+    assert out.decode().splitlines()[-1] == '[]'
+
+
+def test_for_backend_imports_selected_backend_only():
+    code = """
+import sys
+from soopervisor.exporter import for_backend
+from soopervisor.enum import Backend
+
+for_backend(Backend.argo_workflows)
+print('soopervisor.aws.batch' in sys.modules)
+"""
+    out = subprocess.check_output([sys.executable, '-c', code])
+
+    assert out.decode().splitlines()[-1] == 'False'
+
+
+def test_profile(tmp_sample_project, monkeypatch):
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ['add', 'serve', '--backend', 'argo-workflows', '--profile'],
+        catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert 'Phase' in result.output
+
+    trace = json.loads(
+        Path('.soopervisor', 'profile', 'add-serve.json').read_text())
+    names = {event['name'] for event in trace['traceEvents']}
+
+    assert {'load config', 'find spec', 'load DAG', 'add'} <= names
+    assert {event['ph'] for event in trace['traceEvents']} == {'X'}
+
+
+@pytest.mark.parametrize('args, multi_stage', [
+    [[], False],
+    [['--multi-stage'], True],
+    [['--no-multi-stage'], False],
+])
+def test_add_multi_stage(args, multi_stage, tmp_sample_project):
+    runner = CliRunner()
+    result = runner.invoke(cli,
+                           ['add', 'serve', '--backend', 'aws-batch', *args],
+                           catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert ('FROM ubuntu'
+            in Path('serve', 'Dockerfile').read_text()) is multi_stage
+    assert 'multi_stage' not in Path('soopervisor.yaml').read_text()
+
+
+@pytest.mark.parametrize('args, buildkit', [
+    [[], False],
+    [['--buildkit'], True],
+])
+def test_add_buildkit(args, buildkit, tmp_sample_project):
+    runner = CliRunner()
+    result = runner.invoke(cli,
+                           ['add', 'serve', '--backend', 'aws-batch', *args],
+                           catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert ('--mount=type=cache'
+            in Path('serve', 'Dockerfile').read_text()) is buildkit
+
+
+def test_add_passes_none_if_options_are_missing(tmp_sample_project,
+                                                monkeypatch):
+    exporter_ = Mock()
+    monkeypatch.setattr(exporter, 'for_backend', Mock(return_value=exporter_))
+
+    result = CliRunner().invoke(cli,
+                                ['add', 'serve', '--backend', 'aws-batch'],
+                                catch_exceptions=False)
+
+    assert result.exit_code == 0
+    exporter_().add.assert_called_once_with(multi_stage=None, buildkit=None)
@@ -1,17 +1,34 @@
 import os
+import gzip
+import json
+import sys
+import shutil
+import time
 import tarfile
+import threading
 import subprocess
+from glob import iglob
+from itertools import chain
 from pathlib import Path
+from unittest.mock import Mock, ANY
 
 import yaml
 import pytest
 from click import ClickException
+from ploomber import DAG
+from ploomber.dag import dag as dag_module_ploomber
 from ploomber.spec import DAGSpec
+from ploomber.tasks import PythonCallable
+from ploomber.products import File
+from ploomber.clients import LocalStorageClient
 from ploomber.executors import Serial
-from ploomber.io._commander import Commander
+from ploomber.io._commander import Commander, CommanderStop
 
-from soopervisor.commons import source, conda, dependencies
+from soopervisor.commons import (source, conda, dependencies, cache, docker,
+                                 matcher)
+from soopervisor.commons import dag as dag_module
 from soopervisor import commons
+from soopervisor.enum import Compression
 
 
 @pytest.fixture
@@ -33,54 +50,137 @@ def git_init():
     subprocess.check_call(['git', 'commit', '-m', 'commit'])
 
 
-def test_glob_all_excludes_directories(tmp_empty):
+def test_walk_returns_same_files_as_glob(tmp_empty):
+    for path in ['file', '.hidden', 'dir/a', 'dir/.b', 'dir/sub/c',
+                 '.git/config', '.hidden-dir/d', 'dir/.hidden-dir/e']:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).touch()
+
+    hidden = iglob(str(Path('**', '.*')), recursive=True)
+    normal = iglob('**', recursive=True)
+    expected = set(p for p in chain(hidden, normal) if Path(p).is_file())
+
+    assert set(source.walk('.')) == expected
+
+
+def test_walk_does_not_descend_into_pruned_directories(tmp_empty,
+                                                       monkeypatch):
     Path('dir').mkdir()
     Path('dir', 'a').touch()
+    Path('data', 'raw').mkdir(parents=True)
+    Path('data', 'raw', 'b').touch()
+
+    scandir = Mock(wraps=os.scandir)
+    monkeypatch.setattr(source.os, 'scandir', scandir)
+
+    files = set(source.walk('.', prune=lambda d: d == 'data'))
+
+    assert files == {str(Path('dir', 'a'))}
+    assert set(c[0][0] for c in scandir.call_args_list) == {'.', 'dir'}
+
+
+def test_select_does_not_walk_untracked_directories(cmdr, tmp_empty,
+                                                    monkeypatch):
+    Path('file').touch()
+    Path('data').mkdir()
+    Path('data', 'big').touch()
+    Path('.gitignore').write_text('data')
+    git_init()
 
-    assert set(Path(p) for p in source.glob_all('.')) == {Path('dir', 'a')}
+    scandir = Mock(wraps=os.scandir)
+    monkeypatch.setattr(source.os, 'scandir', scandir)
 
+    selected = source.select(cmdr, '.')
 
-def test_global_all_excludes_from_arg(tmp_empty):
+    assert 'data' not in set(c[0][0] for c in scandir.call_args_list)
+    assert selected == ['file']
+
+
+def test_git_files(tmp_empty):
+    Path('file').touch()
     Path('dir').mkdir()
-    Path('dir', 'a').touch()
-    Path('excluded').mkdir()
-    Path('excluded', 'should-not-appear').touch()
+    Path('dir', 'another').touch()
+    Path('secrets.txt').touch()
+    Path('.gitignore').write_text('secrets.txt')
+    git_init()
+    Path('new-file').touch()
 
-    assert set(Path(p) for p in source.glob_all('.', exclude='excluded')) == {
-        Path('dir', 'a')
-    }
+    tracked, untracked, error = source.git_files()
+
+    assert tracked == {'file', str(Path('dir', 'another')), '.gitignore'}
+    assert untracked == {'new-file'}
+    assert error is None
 
 
-def test_copy(cmdr, tmp_empty):
+def test_select_uses_git_index_without_walking(cmdr, tmp_empty,
+                                               monkeypatch):
     Path('file').touch()
+    Path('deleted').touch()
     Path('dir').mkdir()
     Path('dir', 'another').touch()
     git_init()
-    source.copy(cmdr, '.', 'dist')
+    Path('deleted').unlink()
+
+    scandir = Mock(wraps=os.scandir)
+    monkeypatch.setattr(source.os, 'scandir', scandir)
+
+    assert source.select(cmdr, '.') == sorted(
+        ['file', str(Path('dir', 'another'))])
+    scandir.assert_not_called()
+
+
+def test_select_skips_hidden_directories(cmdr, tmp_empty):
+    Path('file').touch()
+    Path('.hidden-file').touch()
+    Path('.github', 'workflows').mkdir(parents=True)
+    Path('.github', 'workflows', 'ci.yml').touch()
+    git_init()
+
+    assert source.select(cmdr, '.') == sorted(['file', '.hidden-file'])
+    assert source.select(cmdr, '.', include=['.github']) == sorted(
+        ['file', '.hidden-file',
+         str(Path('.github', 'workflows', 'ci.yml'))])
+
+
+def test_select_includes_staged_files(cmdr, tmp_empty):
+    Path('file').touch()
+    git_init()
+    Path('staged').touch()
+    subprocess.check_call(['git', 'add', 'staged'])
+
+    assert source.select(cmdr, '.') == ['file', 'staged']
+
+
+def test_select(cmdr, tmp_empty):
+    Path('file').touch()
+    Path('dir').mkdir()
+    Path('dir', 'another').touch()
+    git_init()
+    selected = source.select(cmdr, '.')
 
     expected = set(Path(p) for p in (
-        'dist/file',
-        'dist/dir/another',
+        'file',
+        'dir/another',
     ))
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    assert set(Path(p) for p in selected) == expected
 
 
-def test_copy_with_gitignore(cmdr, tmp_empty):
+def test_select_with_gitignore(cmdr, tmp_empty):
     Path('file').touch()
     Path('ignoreme').touch()
 
     Path('.gitignore').write_text('ignoreme')
     git_init()
-    source.copy(cmdr, '.', 'dist')
+    selected = source.select(cmdr, '.')
 
-    expected = set({Path('dist/file')})
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    expected = set({Path('file')})
+    assert set(Path(p) for p in selected) == expected
 
 
 def test_error_if_exclude_and_include_overlap(cmdr, tmp_empty):
 
     with pytest.raises(ClickException) as excinfo:
-        source.copy(cmdr, '.', 'dist', exclude=['file'], include=['file'])
+        source.select(cmdr, '.', exclude=['file'], include=['file'])
 
     expected = ("include and exclude must "
                 "not have overlapping elements: {'file'}")
@@ -96,30 +196,30 @@ def test_override_git_with_exclude(cmdr, tmp_empty):
     git_init()
 
     # exclude some file
-    source.copy(cmdr, '.', 'dist', exclude=['file'])
+    selected = source.select(cmdr, '.', exclude=['file'])
 
-    expected = set({Path('dist/secrets.txt')})
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    expected = set({Path('secrets.txt')})
+    assert set(Path(p) for p in selected) == expected
 
 
-def test_copy_override_gitignore_with_include(cmdr, tmp_empty):
+def test_select_override_gitignore_with_include(cmdr, tmp_empty):
     Path('file').touch()
     Path('secrets.txt').touch()
 
     Path('.gitignore').write_text('secrets.txt')
     git_init()
 
-    source.copy(cmdr, '.', 'dist', include=['secrets.txt'])
+    selected = source.select(cmdr, '.', include=['secrets.txt'])
 
     expected = set(Path(p) for p in (
-        'dist/file',
-        'dist/secrets.txt',
+        'file',
+        'secrets.txt',
     ))
 
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    assert set(Path(p) for p in selected) == expected
 
 
-def test_copy_override_gitignore_with_include_entire_folder(cmdr, tmp_empty):
+def test_select_override_gitignore_with_include_entire_folder(cmdr, tmp_empty):
     Path('file').touch()
     Path('dir').mkdir()
     Path('dir', 'secrets.txt').touch()
@@ -128,27 +228,27 @@ def test_copy_override_gitignore_with_include_entire_folder(cmdr, tmp_empty):
     Path('.gitignore').write_text('dir')
     git_init()
 
-    source.copy(cmdr, '.', 'dist', include=['dir'])
+    selected = source.select(cmdr, '.', include=['dir'])
 
     expected = set(
         Path(p) for p in (
-            'dist/file',
-            'dist/dir/secrets.txt',
-            'dist/dir/more-secrets.txt',
+            'file',
+            'dir/secrets.txt',
+            'dir/more-secrets.txt',
         ))
 
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    assert set(Path(p) for p in selected) == expected
 
 
 def test_no_git_but_exclude(cmdr, tmp_empty):
     Path('file').touch()
     Path('secrets.txt').touch()
 
-    source.copy(cmdr, '.', 'dist', exclude=['secrets.txt'])
+    selected = source.select(cmdr, '.', exclude=['secrets.txt'])
 
-    expected = set(Path(p) for p in ('dist/file', ))
+    expected = set(Path(p) for p in ('file', ))
 
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    assert set(Path(p) for p in selected) == expected
 
 
 def test_no_git_but_exclude_entire_folder(cmdr, tmp_empty):
@@ -157,10 +257,77 @@ def test_no_git_but_exclude_entire_folder(cmdr, tmp_empty):
     Path('dir', 'secrets.txt').touch()
     Path('dir', 'more-secrets.txt').touch()
 
-    source.copy(cmdr, '.', 'dist', exclude=['dir'])
+    selected = source.select(cmdr, '.', exclude=['dir'])
+
+    expected = set(Path(p) for p in ('file', ))
+    assert set(Path(p) for p in selected) == expected
+
+
+def test_select_with_patterns(cmdr, tmp_empty):
+    Path('file.py').touch()
+    Path('data').mkdir()
+    Path('data', 'raw.csv').touch()
+    Path('data', 'clean.parquet').touch()
+    Path('dir', 'sub').mkdir(parents=True)
+    Path('dir', 'sub', 'notebook.ipynb').touch()
+    Path('dir', 'script.py').touch()
+    Path('.gitignore').write_text('data')
+    git_init()
+
+    selected = source.select(cmdr,
+                             '.',
+                             include=['data/*.csv'],
+                             exclude=['**/*.ipynb'])
+
+    expected = set(
+        Path(p) for p in ('file.py', 'data/raw.csv', 'dir/script.py'))
+    assert set(Path(p) for p in selected) == expected
+
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    ['file', 'file', True],
+    ['file', 'sub/file', False],
+    ['./dir/', 'dir/sub/file', True],
+    ['dir', 'directory', False],
+    ['*.csv', 'data.csv', True],
+    ['*.csv', 'sub/data.csv', False],
+    ['**/*.csv', 'data.csv', True],
+    ['**/*.csv', 'sub/dir/data.csv', True],
+    ['**/*.csv', 'sub/data.csv.bak', False],
+    ['**/*.csv', 'dir.csv/file', True],
+    ['**/build', 'sub/build/file', True],
+    ['**/build', 'sub/rebuild/file', False],
+    ['**/test_*', 'sub/test_a.py', True],
+    ['**/test_*', 'sub/my_test_a.py', False],
+    ['data/**/raw', 'data/a/b/raw/file', True],
+    ['file-?.txt', 'file-1.txt', True],
+    ['file-[!0-9].txt', 'file-1.txt', False],
+    ['file-[!0-9].txt', 'file-a.txt', True],
+    ['a+b(c)', 'a+b(c)', True],
+])
+def test_path_matcher(pattern, path, expected):
+    assert matcher.PathMatcher([pattern])(path) is expected
+
+
+def test_path_matcher_base_dirs():
+    patterns = ['data/*.csv', 'file.txt', '**/*.ipynb', 'a/b/**/c']
+    assert matcher.PathMatcher(patterns).base_dirs() == {
+        'data', 'file.txt', '.', 'a/b'
+    }
+
+
+def test_path_matcher_many_patterns():
+    # checks the results, benchmarks/path_matcher.py reports the time
+    paths = [f'dir-{i % 100}/sub-{i % 7}/file-{i}.py' for i in range(100_000)]
+    patterns = [f'dir-{i}' for i in range(0, 100, 5)]
+    patterns += [f'**/*.ext-{i}' for i in range(20)]
+    patterns += ['**/sub-3/*.py']
+
+    is_excluded = matcher.PathMatcher(patterns)
+    excluded = [p for p in paths if is_excluded(p)]
 
-    expected = set(Path(p) for p in ('dist/file', ))
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    assert len(excluded) == sum(1 for i in range(100_000)
+                                if i % 5 == 0 or i % 7 == 3)
 
 
 def test_ignores_pycache(cmdr, tmp_empty):
@@ -174,10 +341,10 @@ def test_ignores_pycache(cmdr, tmp_empty):
     (dir_another / 'file').touch()
     (dir_another / 'another').touch()
 
-    source.copy(cmdr, '.', 'dist')
+    selected = source.select(cmdr, '.')
 
-    expected = set(Path(p) for p in ('dist/file', ))
-    assert set(Path(p) for p in source.glob_all('dist')) == expected
+    expected = set(Path(p) for p in ('file', ))
+    assert set(Path(p) for p in selected) == expected
 
 
 def test_warns_if_fails_to_get_git_tracked_files(tmp_empty, capsys):
@@ -185,7 +352,7 @@ def test_warns_if_fails_to_get_git_tracked_files(tmp_empty, capsys):
     Path('secrets.txt').touch()
 
     with Commander() as cmdr:
-        source.copy(cmdr, '.', 'dist')
+        source.select(cmdr, '.')
 
     captured = capsys.readouterr()
 
@@ -202,26 +369,837 @@ def test_warns_on_dirty_git(tmp_empty, capsys):
     Path('new-file').touch()
 
     with Commander() as cmdr:
-        source.copy(cmdr, '.', 'dist')
+        source.select(cmdr, '.')
 
     captured = capsys.readouterr()
 
     assert 'Your git repository contains untracked' in captured.out
 
 
-def test_compress_dir(tmp_empty):
-    dir = Path('dist', 'project-name')
-    dir.mkdir(parents=True)
+def test_archive(cmdr, tmp_empty):
+    Path('file').touch()
+    Path('dir').mkdir()
+    Path('dir', 'another').write_text('content')
+    Path('secrets.txt').touch()
+    Path('.gitignore').write_text('secrets.txt')
+    git_init()
+
+    source.archive(source.select(cmdr, '.'),
+                   'dist/project-name.tar.gz',
+                   arcname='project-name')
+
+    # extract like the Dockerfiles do
+    Path('extracted').mkdir()
+    subprocess.check_call([
+        'tar', '--strip-components=1', '-zxf',
+        str(Path('..', 'dist', 'project-name.tar.gz'))
+    ],
+                          cwd='extracted')
+
+    assert not Path('dist', 'project-name').exists()
+    assert set(source.walk('extracted')) == {
+        str(Path('extracted', 'file')),
+        str(Path('extracted', 'dir', 'another')),
+    }
+    assert Path('extracted', 'dir', 'another').read_text() == 'content'
+
+
+def test_archive_stores_symlink_targets(tmp_empty):
+    Path('outside').mkdir()
+    Path('outside', 'data.txt').write_text('content')
+    Path('project').mkdir()
+    os.symlink(Path('outside', 'data.txt').resolve(),
+               Path('project', 'link.txt'))
+    os.chdir('project')
+
+    source.archive(['link.txt'], 'dist/project.tar.gz', arcname='project')
+
+    with tarfile.open('dist/project.tar.gz') as tar:
+        member = tar.getmember('project/link.txt')
+        content = tar.extractfile(member).read()
+
+    assert member.isfile()
+    assert content == b'content'
+
+
+def test_archive_is_reproducible(cmdr, tmp_empty):
+    Path('file').touch()
+    Path('dir').mkdir()
+    Path('dir', 'another').write_text('content')
+    git_init()
+
+    source.archive(source.select(cmdr, '.'),
+                   'dist/first.tar.gz',
+                   arcname='project-name')
+
+    time.sleep(1)
+    Path('dir', 'another').touch()
+
+    source.archive(source.select(cmdr, '.'),
+                   'dist/second.tar.gz',
+                   arcname='project-name')
+
+    assert (cache.hash_file('dist/first.tar.gz') ==
+            cache.hash_file('dist/second.tar.gz'))
+
+
+def test_package_reuses_cached_archive(cmdr, tmp_empty, monkeypatch):
+    Path('file').write_text('content')
+    git_init()
+    cfg = Mock(include=None,
+               exclude=None,
+               compression=Compression.gz,
+               compression_level=6,
+               max_package_size=None)
+    archive = Mock(wraps=source.archive)
+    monkeypatch.setattr(source, 'archive', archive)
+
+    docker._package(cmdr, cfg, 'project-name')
+    first = cache.hash_file('dist/project-name.tar.gz')
+    docker._package(cmdr, cfg, 'project-name')
+
+    assert archive.call_count == 1
+    assert cache.hash_file('dist/project-name.tar.gz') == first
+
+    Path('file').write_text('new content')
+    docker._package(cmdr, cfg, 'project-name')
+
+    assert archive.call_count == 2
+    assert cache.hash_file('dist/project-name.tar.gz') != first
+
+
+def test_package_reuses_cached_sdist(cmdr, tmp_empty):
+    Path('setup.py').touch()
+    Path('src', 'pkg').mkdir(parents=True)
+    Path('src', 'pkg', '__init__.py').write_text('content')
+    Path('soopervisor.yaml').write_text('training:\n  backend: aws-batch\n')
+    git_init()
+    cfg = Mock(compression=Compression.gz,
+               compression_level=6,
+               wheel=False,
+               build_isolation=True)
+
+    def build(*args, **kwargs):
+        # generate the same (untracked) files as python -m build
+        Path('build', 'lib').mkdir(parents=True)
+        Path('build', 'lib', 'file').touch()
+        Path('src', 'pkg', 'pkg.egg-info').mkdir()
+        Path('src', 'pkg', 'pkg.egg-info', 'SOURCES.txt').touch()
+        source.archive(['setup.py'], 'dist/pkg-0.1.tar.gz', arcname='pkg')
+
+    e = Mock(wraps=cmdr)
+    e.run.side_effect = build
+    Path('training').mkdir()
+    Path('training', 'Dockerfile').touch()
+
+    keys = [docker._package(e, cfg, 'pkg')[0] for _ in range(3)]
+
+    assert len(set(keys)) == 1
+    assert e.run.call_count == 1
+    assert Path('dist', 'pkg-0.1.tar.gz').is_file()
+
+    Path('src', 'pkg', '__init__.py').write_text('new content')
+    docker._package(e, cfg, 'pkg')
+
+    assert e.run.call_count == 2
+
+
+@pytest.mark.parametrize('path, manifest', [
+    ['generated.txt', 'include generated.txt\n'],
+    [str(Path('src', 'pkg', 'model.bin')), ''],
+],
+                         ids=['manifest', 'package-data'])
+def test_package_rebuilds_sdist_if_ignored_file_changes(
+        cmdr, tmp_empty, path, manifest):
+    Path('setup.py').touch()
+    Path('src', 'pkg').mkdir(parents=True)
+    Path('src', 'pkg', '__init__.py').touch()
+    Path('MANIFEST.in').write_text(manifest)
+    Path('.gitignore').write_text(f'{Path(path).name}\n')
+    Path(path).write_text('content')
+    git_init()
+    cfg = Mock(compression=Compression.gz,
+               compression_level=6,
+               wheel=False,
+               build_isolation=True)
+    e = Mock(wraps=cmdr)
+    e.run.side_effect = lambda *args, **kwargs: source.archive(
+        ['setup.py'], 'dist/pkg-0.1.tar.gz', arcname='pkg')
+
+    docker._package(e, cfg, 'pkg')
+    docker._package(e, cfg, 'pkg')
+
+    assert e.run.call_count == 1
+
+    Path(path).write_text('new content')
+    docker._package(e, cfg, 'pkg')
+
+    assert e.run.call_count == 2
+
+
+def test_package_rebuilds_sdist_if_version_changes(cmdr, tmp_empty):
+    Path('setup.py').touch()
+    git_init()
+    cfg = Mock(compression=Compression.gz,
+               compression_level=6,
+               wheel=False,
+               build_isolation=True)
+    e = Mock(wraps=cmdr)
+    e.run.side_effect = lambda *args, **kwargs: source.archive(
+        ['setup.py'], 'dist/pkg-0.1.tar.gz', arcname='pkg')
+
+    docker._package(e, cfg, 'pkg')
+
+    # setuptools_scm and versioneer take the version from git tags
+    subprocess.check_call(['git', 'tag', '0.1'])
+    docker._package(e, cfg, 'pkg')
+
+    assert e.run.call_count == 2
+
+
+def test_manifest_files(tmp_empty):
+    Path('data').mkdir()
+    Path('data', 'a.csv').touch()
+    Path('data', 'b.txt').touch()
+    Path('README').touch()
+    Path('MANIFEST.in').write_text('# comment\n'
+                                   'include README missing\n'
+                                   'recursive-include data *.csv\n')
+
+    assert source.manifest_files() == ['README', str(Path('data', 'a.csv'))]
+
+
+@pytest.mark.parametrize('compression, name', [
+    ['none', 'project-name.tar'],
+    ['gz', 'project-name.tar.gz'],
+    ['parallel-gz', 'project-name.tar.gz'],
+])
+def test_archive_compression(tmp_empty, compression, name):
+    Path('dir').mkdir()
+    Path('dir', 'data').write_bytes(os.urandom(1024) * 1024)
+
+    source.archive([str(Path('dir', 'data'))],
+                   Path('dist', name),
+                   arcname='project-name',
+                   compression=compression,
+                   level=1)
+
+    # tar detects the compression format, like the Dockerfiles do
+    Path('extracted').mkdir()
+    subprocess.check_call(
+        ['tar', '--strip-components=1', '-xf',
+         str(Path('..', 'dist', name))],
+        cwd='extracted')
+
+    assert (Path('extracted', 'dir', 'data').read_bytes() == Path(
+        'dir', 'data').read_bytes())
+
+
+def test_parallel_gzip_writer_writes_gzip_members(tmp_empty):
+    Path('data').write_bytes(os.urandom(10_000))
+
+    with open('data.tar.gz', 'wb') as f:
+        writer = source._ParallelGzipWriter(f, level=6, block_size=1024)
+
+        with tarfile.open(fileobj=writer, mode='w') as tar:
+            tar.add('data')
+
+        writer.close()
+
+    with tarfile.open('data.tar.gz', 'r:gz') as tar:
+        content = tar.extractfile('data').read()
+
+    assert content == Path('data').read_bytes()
+
+
+def test_compress_block(monkeypatch):
+    # gzip.compress has no mtime argument in Python < 3.8
+    monkeypatch.setattr(source.gzip, 'compress',
+                        Mock(side_effect=TypeError('unexpected argument')))
+    block = os.urandom(1024)
+
+    member = source._compress_block(block, level=6)
+
+    assert gzip.decompress(member) == block
+    # no timestamp in the header
+    assert member[4:8] == bytes(4)
+
+
+@pytest.mark.parametrize('build_isolation, wheel, args', [
+    [True, False, ('python', '-m', 'build', '--sdist')],
+    [False, False, ('python', '-m', 'build', '--sdist', '--no-isolation')],
+    [True, True, ('python', '-m', 'build', '--sdist', '--wheel')],
+])
+def test_package_sdist(tmp_empty, build_isolation, wheel, args):
+    Path('setup.py').touch()
+    e = Mock()
+    cfg = Mock(compression=Compression.gz,
+               compression_level=6,
+               build_isolation=build_isolation,
+               wheel=wheel)
+
+    docker._package(e, cfg, 'pkg')
+
+    e.rm.assert_any_call('build', Path('src', 'pkg', 'pkg.egg-info'))
+    e.run.assert_called_once_with(*args, description='Packaging code')
+
+
+def test_fingerprint(tmp_empty, monkeypatch):
+    Path('a').write_text('a')
+    Path('b').write_text('b')
+
+    first = cache.fingerprint(['a', 'b'])
+
+    hash_file = Mock(wraps=cache.hash_file)
+    monkeypatch.setattr(cache, 'hash_file', hash_file)
+
+    assert cache.fingerprint(['a', 'b']) == first
+    hash_file.assert_not_called()
+
+    Path('b').write_text('changed')
+
+    assert cache.fingerprint(['a', 'b']) != first
+    hash_file.assert_called_once_with('b')
+
+
+def test_evict(tmp_empty):
+    for i, name in enumerate(['first', 'second', 'third']):
+        path = cache.path_to_cache('package', name)
+        path.mkdir(parents=True)
+        os.utime(path, (i, i))
+
+    cache.evict('package', keep=2)
+
+    assert set(p.name for p in cache.path_to_cache('package').iterdir()) == {
+        'second', 'third'
+    }
+
+
+def test_size_report():
+    sizes = {
+        'data/big.parquet': 3 * 1024**3,
+        'data/small.csv': 1024,
+        'src/pkg/a.py': 10,
+        'README.md': 20,
+    }
+
+    report = source.size_report(sizes, top=2)
+
+    assert report.splitlines() == [
+        'Package size: 3.0 GB (4 files)',
+        'Largest files:',
+        '      3.0 GB  data/big.parquet',
+        '      1.0 KB  data/small.csv',
+        'Size by directory:',
+        '      3.0 GB  data/',
+        '        20 B  (root)',
+    ]
+
+
+def test_package_sizes_from_sdist(tmp_empty):
+    Path('pkg-0.1', 'src').mkdir(parents=True)
+    Path('pkg-0.1', 'src', 'module.py').write_bytes(b'x' * 10)
+    Path('pkg-0.1', 'setup.py').write_bytes(b'x' * 5)
+    Path('dist').mkdir()
+
+    with tarfile.open('dist/pkg-0.1.tar.gz', 'w:gz') as tar:
+        tar.add('pkg-0.1')
+
+    assert docker._package_sizes([], setup_py=True) == {
+        'src/module.py': 10,
+        'setup.py': 5,
+    }
+
+
+def test_error_if_package_exceeds_max_size(cmdr):
+    cfg = Mock(max_package_size=100)
+
+    docker._check_package_size(cmdr, cfg, {'file': 100})
+
+    with pytest.raises(ClickException) as excinfo:
+        docker._check_package_size(cmdr, cfg, {'file': 60, 'another': 50})
+
+    assert 'exceeds max_package_size (100 B)' in str(excinfo.value)
+
+
+@pytest.fixture
+def dockerfile_with_deps(tmp_empty):
+    Path('Dockerfile').write_text('ARG DEPS_IMAGE=deps\n'
+                                  'FROM base AS deps\nRUN install\n'
+                                  'FROM ${DEPS_IMAGE}\nCOPY dist/* project/\n')
+    Path('requirements.lock.txt').write_text('pkg==1.0')
+
+
+@pytest.mark.parametrize('exists, pulled, repository, built', [
+    [True, False, 'repo/name', False],
+    [False, True, 'repo/name', False],
+    [False, False, 'repo/name', True],
+    [False, True, None, True],
+])
+def test_deps_image(dockerfile_with_deps, monkeypatch, exists, pulled,
+                    repository, built):
+    monkeypatch.setattr(docker, '_image_exists', lambda image: exists)
+    monkeypatch.setattr(docker, '_pull', lambda image: pulled)
+    e = Mock()
+
+    image, was_built = docker._deps_image(e,
+                                          Mock(repository=repository),
+                                          'pkg')
+
+    assert image.startswith(f'{repository or "pkg"}-deps:')
+    assert was_built is built
+    assert (e.run.call_args is not None) is built
+
+    if built:
+        assert e.run.call_args[0][:6] == ('docker', 'build', '.', '--target',
+                                          'deps', '--tag')
+
+
+def test_deps_image_tag_changes_with_lock_file(dockerfile_with_deps,
+                                               monkeypatch):
+    monkeypatch.setattr(docker, '_image_exists', lambda image: True)
+    cfg = Mock(repository='repo/name')
+
+    first, _ = docker._deps_image(Mock(), cfg, 'pkg')
+    Path('Dockerfile').write_text(Path('Dockerfile').read_text() +
+                                  'RUN more-code\n')
+    same, _ = docker._deps_image(Mock(), cfg, 'pkg')
+    Path('requirements.lock.txt').write_text('pkg==2.0')
+    different, _ = docker._deps_image(Mock(), cfg, 'pkg')
+
+    assert first == same
+    assert first != different
+
+
+@pytest.mark.parametrize('dockerfile', [
+    'FROM base\n',
+    'FROM base AS deps\nRUN install\nFROM deps\n',
+],
+                         ids=['no-stage', 'no-arg'])
+def test_deps_image_requires_deps_stage(tmp_empty, dockerfile):
+    Path('Dockerfile').write_text(dockerfile)
+
+    with pytest.raises(ClickException) as excinfo:
+        docker._deps_image(Mock(), Mock(repository=None), 'pkg')
+
+    assert 'requires a Dockerfile with a "deps" stage' in str(excinfo.value)
+
 
-    (dir / 'file').touch()
+def test_deps_stage():
+    dockerfile = ('ARG DEPS_IMAGE=deps\n'
+                  'FROM base as deps\nRUN install\n\n'
+                  'FROM ${DEPS_IMAGE} AS builder\nRUN build\n')
 
-    source.compress_dir('dist/project-name', 'dist/project-name.tar.gz')
+    assert (docker._deps_stage(dockerfile) ==
+            'FROM base as deps\nRUN install\n\n')
+    assert docker._deps_stage('FROM base AS deps\n') == 'FROM base AS deps\n'
+    assert docker._deps_stage('FROM base\n') is None
 
-    with tarfile.open('dist/project-name.tar.gz', 'r:gz') as tar:
-        tar.extractall('.')
 
-    expected = {Path('project-name/file')}
-    assert set(Path(p) for p in source.glob_all('project-name')) == expected
+def test_build_starts_from_deps_image(build_env, dockerfile_with_deps,
+                                      monkeypatch):
+    e, cfg, pkg_name = build_env
+    cfg.deps_image = True
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: False)
+    monkeypatch.setattr(docker, '_pull', lambda image: False)
+
+    with pytest.raises(CommanderStop):
+        docker.build(e, cfg, 'env', until='build', skip_tests=True)
+
+    deps, build = _docker_commands(e, 'build')
+    image = deps[deps.index('--tag') + 1]
+
+    assert image.startswith('repo/name-deps:')
+    assert build[build.index('--build-arg') + 1] == f'DEPS_IMAGE={image}'
+    assert '--cache-from' not in build
+
+
+@pytest.mark.parametrize('enabled, previous, expected', [
+    [True, None, '1'],
+    [True, '0', '1'],
+    [False, None, None],
+    [False, '0', '0'],
+])
+def test_buildkit_env(monkeypatch, enabled, previous, expected):
+    if previous is None:
+        monkeypatch.delenv('DOCKER_BUILDKIT', raising=False)
+    else:
+        monkeypatch.setenv('DOCKER_BUILDKIT', previous)
+
+    with docker._buildkit(enabled=enabled):
+        assert os.environ.get('DOCKER_BUILDKIT') == expected
+
+    assert os.environ.get('DOCKER_BUILDKIT') == previous
+
+
+@pytest.fixture
+def build_env(tmp_empty, monkeypatch):
+    Path('pipeline.yaml').touch()
+    Path('requirements.lock.txt').write_text('pkg==1.0')
+    Path('Dockerfile').write_text('FROM base\n')
+    monkeypatch.setattr(docker, '_package', lambda e, cfg, pkg_name:
+                        ('package-key', {}))
+    monkeypatch.setattr(docker, '_test_image', Mock())
+    monkeypatch.setattr(docker, '_built_images', {})
+    cfg = Mock(repository='repo/name',
+               max_package_size=None,
+               deps_image=False,
+               buildkit=False,
+               buildx=False)
+    return Mock(), cfg, Path(tmp_empty).name
+
+
+def _docker_commands(e, command):
+    return [c[0] for c in e.run.call_args_list if c[0][1] == command]
+
+
+def test_build_skips_if_image_in_registry(build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: True)
+
+    name, image = docker.build(e, cfg, 'env', until=None)
+
+    assert image.startswith('repo/name:content-')
+    assert not e.run.call_args_list
+
+
+def test_build_skips_if_image_exists_locally(build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: True)
+
+    name, image = docker.build(e, cfg, 'env', until=None)
+
+    assert image == 'repo/name:latest'
+    assert not _docker_commands(e, 'build')
+    assert not _docker_commands(e, 'run')
+    assert [c[-1] for c in _docker_commands(e, 'push')
+            ] == ['repo/name:latest', ANY]
+
+
+@pytest.mark.parametrize('skip_tests', [False, True])
+def test_build_tags_tested_images_with_content_key(build_env, monkeypatch,
+                                                   skip_tests):
+    e, cfg, pkg_name = build_env
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: False)
+
+    with pytest.raises(CommanderStop):
+        docker.build(e, cfg, 'env', until='build', skip_tests=skip_tests)
+
+    build, = _docker_commands(e, 'build')
+    tags = _docker_commands(e, 'tag')
+
+    assert build[6].startswith('soopervisor.content-key=')
+
+    if skip_tests:
+        assert not tags
+    else:
+        assert tags == [('docker', 'tag', f'{pkg_name}:latest',
+                         f'{pkg_name}:content-{build[6][-64:][:16]}')]
+
+
+def _run_check_script():
+    out = subprocess.check_output(
+        [sys.executable, '-c', docker._check_script()])
+    return json.loads(out.decode().strip().splitlines()[-1])['checks']
+
+
+def test_check_script(tmp_fast_pipeline):
+    checks = _run_check_script()
+
+    assert [(c['name'], c['passed']) for c in checks] == [
+        ('load DAG', True),
+        ('status', True),
+        ('File client', True),
+    ]
+
+
+def test_check_script_missing_file_client(tmp_sample_project):
+    checks = _run_check_script()
+
+    assert [(c['name'], c['passed']) for c in checks] == [
+        ('load DAG', True),
+        ('status', True),
+        ('File client', False),
+    ]
+    assert 'Missing File client' in checks[2]['error']
+
+
+def test_check_script_skips_checks_if_dag_fails_to_load(tmp_empty):
+    Path('pipeline.yaml').write_text('tasks: [{source: missing.sql}]')
+
+    checks = _run_check_script()
+
+    assert [(c['name'], c['passed']) for c in checks] == [
+        ('load DAG', False),
+        ('status', False),
+        ('File client', False),
+    ]
+    assert checks[1]['error'] == 'Not run'
+
+
+def test_test_image_runs_a_single_container():
+    e = Mock()
+    e.run.return_value = ('some output\n'
+                          '{"checks": [{"name": "status", "passed": true}]}\n')
+
+    docker._test_image(e, 'image:latest')
+
+    args, = [c[0] for c in e.run.call_args_list]
+    assert args[:4] == ('docker', 'run', '--rm', 'image:latest')
+
+
+def test_test_image_raises_on_failed_checks():
+    results = dict(checks=[
+        dict(name='status', passed=True, error=None),
+        dict(name='File client', passed=False, error='Missing File client'),
+    ])
+    e = Mock()
+    e.run.return_value = json.dumps(results)
+
+    with pytest.raises(ClickException) as excinfo:
+        docker._test_image(e, 'image:latest')
+
+    assert '* File client: Missing File client' in str(excinfo.value)
+    assert '* status' not in str(excinfo.value)
+
+
+@pytest.fixture
+def ledger_env(tmp_empty, monkeypatch):
+    test_image = Mock()
+    monkeypatch.setattr(docker, '_test_image', test_image)
+    monkeypatch.setattr(docker, '_image_id', lambda image: 'sha256:abc')
+    return test_image
+
+
+def test_test_image_once_skips_tested_images(ledger_env):
+    e = Mock()
+
+    docker._test_image_once(e, 'image:latest')
+    docker._test_image_once(e, 'image:latest')
+
+    ledger_env.assert_called_once_with(e, 'image:latest')
+    assert 'already passed the tests' in e.info.call_args[0][0]
+
+
+def test_test_image_once_keys_by_image_id(ledger_env, monkeypatch):
+    docker._test_image_once(Mock(), 'image:latest')
+    monkeypatch.setattr(docker, '_image_id', lambda image: 'sha256:def')
+    docker._test_image_once(Mock(), 'image:latest')
+
+    assert ledger_env.call_count == 2
+
+
+def test_test_image_once_keys_by_check_script(ledger_env, monkeypatch):
+    docker._test_image_once(Mock(), 'image:latest')
+    monkeypatch.setattr(docker, '_check_script', lambda: 'new checks')
+    docker._test_image_once(Mock(), 'image:latest')
+
+    assert ledger_env.call_count == 2
+
+
+def test_test_image_once_does_not_record_failures(ledger_env):
+    ledger_env.side_effect = ClickException('failed')
+
+    for _ in range(2):
+        with pytest.raises(ClickException):
+            docker._test_image_once(Mock(), 'image:latest')
+
+    assert ledger_env.call_count == 2
+
+
+def test_test_image_once_limits_ledger_size(ledger_env, monkeypatch):
+    monkeypatch.setattr(docker, '_TESTED_IMAGES_TO_KEEP', 2)
+
+    for image_id in ['a', 'b', 'c']:
+        monkeypatch.setattr(docker, '_image_id', lambda image: image_id)
+        docker._test_image_once(Mock(), 'image:latest')
+
+    ledger = cache.load(cache.path_to_cache('tested-images.json'))
+    assert [key.split(':')[0] for key in ledger] == ['b', 'c']
+
+
+def test_build_tests_locally_reused_images(build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: True)
+
+    docker.build(e, cfg, 'env', until=None)
+
+    docker._test_image.assert_called_once_with(e, f'{pkg_name}:latest')
+
+
+@pytest.fixture
+def push_env(monkeypatch):
+    monkeypatch.setattr(docker, '_image_id', lambda image: 'sha256:abc')
+    monkeypatch.setattr(
+        docker, '_remote_image_id', lambda image: 'sha256:abc'
+        if image == 'repo:latest' else 'sha256:old')
+
+
+def test_push_skips_up_to_date_images(push_env):
+    e = Mock()
+
+    docker._push(e, 'name:latest', ['repo:latest', 'repo:content-key'])
+
+    assert [c[0] for c in e.run.call_args_list] == [
+        ('docker', 'tag', 'name:latest', 'repo:content-key'),
+        ('docker', 'push', 'repo:content-key'),
+    ]
+    assert 'repo:latest is up to date' in e.info.call_args[0][0]
+
+
+@pytest.mark.parametrize('stdout, expected', [
+    [b'{"config": {"digest": "sha256:abc"}}', 'sha256:abc'],
+    [b'{"manifests": []}', None],
+])
+def test_remote_image_id(monkeypatch, stdout, expected):
+    run = Mock(return_value=Mock(returncode=0, stdout=stdout))
+    monkeypatch.setattr(docker.subprocess, 'run', run)
+
+    assert docker._remote_image_id('repo:latest') == expected
+
+
+@pytest.fixture
+def local_registry():
+    name = 'soopervisor-test-registry'
+    subprocess.check_call([
+        'docker', 'run', '--detach', '--rm', '--publish', '5000:5000',
+        '--name', name, 'registry:2'
+    ])
+    yield 'localhost:5000'
+    subprocess.check_call(['docker', 'stop', name])
+
+
+@pytest.mark.skipif(shutil.which('docker') is None,
+                    reason='requires docker')
+def test_push_to_local_registry(tmp_empty, local_registry):
+    Path('Dockerfile').write_text('FROM busybox\nRUN echo hello > /hello\n')
+    subprocess.check_call(['docker', 'build', '.', '--tag', 'push-test:1'])
+    remote = f'{local_registry}/push-test:1'
+
+    with Commander() as cmdr:
+        e = Mock(wraps=cmdr)
+        docker._push(e, 'push-test:1', [remote])
+        docker._push(e, 'push-test:1', [remote])
+
+    assert docker._remote_image_id(remote) == docker._image_id('push-test:1')
+    assert [c[0][1] for c in e.run.call_args_list] == ['tag', 'push']
+
+
+def test_build_shares_image_between_targets(build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: False)
+
+    # the mocked commander does not change directories
+    for name in ['training', 'batch-training']:
+        with pytest.raises(CommanderStop):
+            docker.build(e, cfg, name, until='build', skip_tests=True)
+
+    assert len(_docker_commands(e, 'build')) == 1
+    assert 'has the same content' in e.info.call_args[0][0]
+
+
+def test_build_does_not_share_image_if_dockerfile_differs(
+        build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: False)
+
+    for name in ['training', 'batch-training']:
+        Path('Dockerfile').write_text(f'FROM {name}\n')
+
+        with pytest.raises(CommanderStop):
+            docker.build(e, cfg, name, until='build', skip_tests=True)
+
+    assert len(_docker_commands(e, 'build')) == 2
+
+
+def test_write_dockerignore(tmp_empty):
+    Path('Dockerfile').write_text('FROM python\n'
+                                  'COPY requirements.lock.txt project/\n'
+                                  'COPY dist/* /dist/\n')
+    docker.write_dockerignore('.')
+    generated = Path('.dockerignore').read_text()
+
+    assert generated.splitlines()[2:] == [
+        '*',
+        '!requirements.lock.txt',
+        '!dist/*',
+    ]
+
+    Path('.dockerignore').write_text(generated.replace('!dist', '!dist-old'))
+    docker.write_dockerignore('.')
+
+    assert Path('.dockerignore').read_text() == generated
+
+    Path('.dockerignore').write_text('custom')
+    docker.write_dockerignore('.')
+
+    assert Path('.dockerignore').read_text() == 'custom'
+
+
+def test_write_dockerignore_updates_with_dockerfile(tmp_empty):
+    Path('Dockerfile').write_text('FROM python\nCOPY dist/* /dist/\n')
+    docker.write_dockerignore('.')
+
+    Path('Dockerfile').write_text('FROM python\nCOPY dist/* /dist/\n'
+                                  'COPY config.yaml /project/\n')
+    docker.write_dockerignore('.')
+
+    assert '!config.yaml' in Path('.dockerignore').read_text().splitlines()
+
+
+@pytest.mark.parametrize('dockerfile, expected', [
+    ['FROM python\n', []],
+    ['copy a.txt b.txt /dst/\n', ['a.txt', 'b.txt']],
+    ['ADD --chown=1 ./a.txt /dst/\n', ['a.txt']],
+    ['COPY ["a b.txt", "/dst/"]\n', ['a b.txt']],
+    ['COPY --chown=1 ["a.txt", "/dst/"]\n', ['a.txt']],
+    ['COPY \\\n    a.txt \\\n    /dst/\n', ['a.txt']],
+    ['# COPY a.txt /dst/\nCOPY --from=builder /project /project\n', []],
+    ['ADD https://example.com/file.txt /dst/\n', []],
+    ['COPY . /project/\n', None],
+    ['COPY $FILE /project/\n', None],
+])
+def test_copied_files(tmp_empty, dockerfile, expected):
+    Path('Dockerfile').write_text(dockerfile)
+    assert docker._copied_files(Path('Dockerfile')) == expected
+
+
+def test_write_dockerignore_copies_everything(tmp_empty):
+    Path('Dockerfile').write_text('FROM python\nCOPY . /project/\n')
+    docker.write_dockerignore('.')
+
+    assert '*' not in Path('.dockerignore').read_text().splitlines()
+    assert docker.context_size('.')[1] == 2
+
+
+def test_context_size(tmp_empty):
+    Path('dist').mkdir()
+    Path('dist', 'project.tar.gz').write_bytes(b'x' * 100)
+    Path('requirements.lock.txt').write_bytes(b'x' * 10)
+    Path('notebooks').mkdir()
+    Path('notebooks', 'big.ipynb').write_bytes(b'x' * 1000)
+    Path('Dockerfile').write_bytes(b'COPY requirements.lock.txt dist/* /p/')
+
+    assert docker.context_size('.') == (1147, 4)
+
+    docker.write_dockerignore('.')
+
+    assert docker.context_size('.') == (110, 2)
+
+
+@pytest.mark.parametrize('size, expected', [
+    [10, '10 B'],
+    [2048, '2.0 KB'],
+    [3 * 1024**3, '3.0 GB'],
+])
+def test_format_size(size, expected):
+    assert source.format_size(size) == expected
 
 
 @pytest.mark.parametrize('env_yaml, expected', [
@@ -368,3 +1346,211 @@ def test_check_lock_files_exist(tmp_empty):
     expected = ('Expected requirements.txt.lock or environment.lock.yml at '
                 'the root directory')
     assert expected in str(excinfo.value)
+
+
+def test_load_tasks_caches_structure(cmdr, tmp_fast_pipeline,
+                                     add_current_to_sys_path,
+                                     no_sys_modules_cache, monkeypatch):
+    tasks, args = commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    # a cache hit must not initialize the spec
+    monkeypatch.setattr(dag_module, 'DAGSpec', Mock(side_effect=ValueError))
+    tasks_cached, args_cached = commons.load_tasks(cmdr=cmdr, mode='force')
+
+    assert tasks == tasks_cached == {'root': [], 'another': ['root']}
+    assert args_cached == ['--entry-point pipeline.yaml', '--force']
+
+
+@pytest.mark.parametrize('to_modify', ['pipeline.yaml', 'fast_pipeline.py'])
+def test_load_tasks_cache_invalidated_on_source_change(
+        cmdr, tmp_fast_pipeline, add_current_to_sys_path, no_sys_modules_cache,
+        monkeypatch, to_modify):
+    # other tests may have imported the module from another directory
+    monkeypatch.delitem(sys.modules, 'fast_pipeline', raising=False)
+    commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    path = Path(to_modify)
+    path.write_text(path.read_text() + '\n# some comment\n')
+
+    spec = Mock(wraps=DAGSpec)
+    monkeypatch.setattr(dag_module, 'DAGSpec', spec)
+    tasks, _ = commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    spec.assert_called_once_with('pipeline.yaml')
+    assert tasks == {'root': [], 'another': ['root']}
+
+
+def test_load_tasks_does_not_cache_factory_dags(cmdr, tmp_empty,
+                                                add_current_to_sys_path,
+                                                no_sys_modules_cache,
+                                                monkeypatch):
+    factory = """
+from ploomber import DAG
+from ploomber.tasks import PythonCallable
+from ploomber.products import File
+
+
+def touch(product):
+    pass
+
+
+def make():
+    dag = DAG()
+{tasks}
+    return dag
+"""
+    task = ("    PythonCallable(touch, File('{name}'), dag, name='{name}')\n")
+    monkeypatch.delitem(sys.modules, 'factory', raising=False)
+    Path('pipeline.yaml').write_text('location: factory.make\n')
+    Path('factory.py').write_text(factory.format(tasks=task.format(name='a')))
+
+    tasks, _ = commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    Path('factory.py').write_text(
+        factory.format(tasks=task.format(name='a') + task.format(name='b')))
+    monkeypatch.delitem(sys.modules, 'factory')
+    tasks_new, _ = commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    assert tasks == {'a': []}
+    assert tasks_new == {'a': [], 'b': []}
+    assert not Path('.soopervisor', 'cache', 'dag').exists()
+
+
+def test_load_tasks_cache_invalidated_on_imported_tasks_change(
+        cmdr, tmp_fast_pipeline, add_current_to_sys_path, no_sys_modules_cache,
+        monkeypatch):
+    tasks = yaml.safe_load(Path('pipeline.yaml').read_text())
+    Path('tasks').mkdir()
+    Path('tasks', 'tasks.yaml').write_text(yaml.safe_dump(tasks['tasks']))
+    tasks['tasks'] = []
+    tasks['meta'] = {'import_tasks_from': 'tasks/tasks.yaml'}
+    Path('pipeline.yaml').write_text(yaml.safe_dump(tasks))
+
+    commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    imported = yaml.safe_load(Path('tasks', 'tasks.yaml').read_text())
+    Path('tasks', 'tasks.yaml').write_text(yaml.safe_dump(imported[:1]))
+    tasks, _ = commons.load_tasks(cmdr=cmdr, mode='regular')
+
+    assert tasks == {'root': []}
+
+
+def test_clear_cache(cmdr, tmp_fast_pipeline, add_current_to_sys_path):
+    session = commons.DAGSession(cmdr=cmdr)
+    session.structure()
+    session.clear_cache()
+
+    assert not list(Path('.soopervisor', 'cache', 'dag').iterdir())
+
+
+def _touch(product):
+    Path(product).touch()
+
+
+def _touch_with_upstream(product, upstream):
+    Path(product).touch()
+
+
+class SlowClient(LocalStorageClient):
+    """
+    Local storage client that simulates network latency and keeps track of
+    the number of concurrent requests
+    """
+    def __init__(self, *args, latency=0.05, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        time.sleep(self.latency)
+
+        with self._lock:
+            self.in_flight -= 1
+
+    def _remote_exists(self, local):
+        self._request()
+        return super()._remote_exists(local)
+
+    def download(self, local, destination=None):
+        self._request()
+        return super().download(local, destination=destination)
+
+
+def _make_dag(client, n_tasks):
+    dag = DAG(executor=Serial(build_in_subprocess=False))
+    dag.clients[File] = client
+    root = PythonCallable(_touch, File('out/root'), dag, name='root')
+
+    for i in range(n_tasks):
+        root >> PythonCallable(_touch_with_upstream,
+                               File(f'out/{i}'),
+                               dag,
+                               name=f'task-{i}')
+
+    return dag
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_resolve_outdated_fetches_concurrently(cmdr, tmp_empty, max_workers):
+    _make_dag(LocalStorageClient('remote', path_to_project_root='.'),
+              n_tasks=10).build(show_progress=False)
+
+    # upstream tasks are outdated if their remote metadata is missing
+    Path('remote', 'out', '.3.metadata').unlink()
+    Path('pipeline.yaml').touch()
+
+    fetch = dag_module_ploomber.fetch_remote_metadata_in_parallel
+    client = SlowClient('remote', path_to_project_root='.')
+    session = commons.DAGSession(cmdr=cmdr, max_workers=max_workers)
+    session._spec = Mock(to_dag=lambda: _make_dag(client, n_tasks=10))
+
+    session.render()
+    requests_render = client.requests
+    outdated = session.outdated()
+
+    # the resolver is the only place where remote metadata is fetched
+    assert not requests_render
+    assert outdated == ['task-3']
+    assert client.max_in_flight == max_workers
+    assert dag_module_ploomber.fetch_remote_metadata_in_parallel is fetch
+
+
+def test_build_with_buildx_tests_and_pushes_the_loaded_image(
+        build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    cfg.buildx = True
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: False)
+
+    docker.build(e, cfg, 'env', until=None)
+
+    build, = _docker_commands(e, 'buildx')
+    assert build[:7] == ('docker', 'buildx', 'build', '.', '--load', '--tag',
+                         f'{pkg_name}:latest')
+    assert '--push' not in build
+    docker._test_image.assert_called_once_with(e, f'{pkg_name}:latest')
+    assert [c[-1] for c in _docker_commands(e, 'push')
+            ] == ['repo/name:latest', ANY]
+
+
+def test_build_with_buildx_pushes_untested_image_in_the_build(
+        build_env, monkeypatch):
+    e, cfg, pkg_name = build_env
+    cfg.buildx = True
+    monkeypatch.setattr(docker, '_exists_in_registry', lambda image: False)
+    monkeypatch.setattr(docker, '_image_exists', lambda image: False)
+
+    docker.build(e, cfg, 'env', until=None, skip_tests=True)
+
+    build, = _docker_commands(e, 'buildx')
+    assert build[-3:] == ('--tag', 'repo/name:latest', '--push')
+    assert not docker._test_image.called
+    assert not _docker_commands(e, 'push')
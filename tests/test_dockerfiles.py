@@ -0,0 +1,107 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+from jinja2 import Environment, PackageLoader, StrictUndefined
+
+from soopervisor.commons import source
+
+BACKENDS = ['aws-batch', 'argo-workflows', 'airflow']
+
+
+def render(backend, **kwargs):
+    env = Environment(loader=PackageLoader('soopervisor', 'assets'),
+                      undefined=StrictUndefined)
+    return env.get_template(f'{backend}/Dockerfile').render(**kwargs)
+
+
+def froms(dockerfile):
+    return [
+        line for line in dockerfile.splitlines() if line.startswith('FROM')
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('conda', [True, False])
+@pytest.mark.parametrize('setup_py', [True, False])
+def test_multi_stage(backend, conda, setup_py):
+    dockerfile = render(backend,
+                        conda=conda,
+                        setup_py=setup_py,
+                        multi_stage=True,
+                        buildkit=False)
+
+    assert froms(dockerfile) == [
+        'FROM condaforge/mambaforge:4.10.1-0 AS deps',
+        'FROM ${DEPS_IMAGE} AS builder',
+        'FROM ubuntu:20.04',
+    ]
+    assert 'ARG DEPS_IMAGE=deps' in dockerfile
+    assert 'COPY dist/* /dist/' in dockerfile
+    assert 'COPY --from=builder /opt/conda /opt/conda' in dockerfile
+    assert 'COPY --from=builder /project /project' in dockerfile
+    assert ('pip install /dist/*.whl --no-deps' in dockerfile) is setup_py
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_single_stage(backend):
+    dockerfile = render(backend,
+                        conda=False,
+                        setup_py=False,
+                        multi_stage=False,
+                        buildkit=False)
+
+    assert froms(dockerfile) == [
+        'FROM condaforge/mambaforge:4.10.1-0 AS deps',
+        'FROM ${DEPS_IMAGE}',
+    ]
+    assert 'ARG DEPS_IMAGE=deps' in dockerfile
+    assert 'COPY dist/* project/' in dockerfile
+    assert '--from=builder' not in dockerfile
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('conda, mount', [
+    [True, 'RUN --mount=type=cache,target=/opt/conda/pkgs mamba'],
+    [False, 'RUN --mount=type=cache,target=/root/.cache/pip pip'],
+])
+def test_buildkit(backend, conda, mount):
+    dockerfile = render(backend,
+                        conda=conda,
+                        setup_py=False,
+                        multi_stage=True,
+                        buildkit=True)
+
+    assert mount in dockerfile
+    assert 'conda clean' not in dockerfile
+    assert 'rm -rf /root/.cache/pip/' not in dockerfile
+
+
+def build_image(tag):
+    subprocess.check_call(['docker', 'build', '.', '--tag', tag])
+    out = subprocess.check_output(
+        ['docker', 'image', 'inspect', '--format', '{{.Size}}', tag])
+    return int(out)
+
+
+@pytest.mark.skipif(shutil.which('docker') is None,
+                    reason='requires docker')
+def test_multi_stage_image_is_smaller(tmp_empty):
+    Path('requirements.lock.txt').write_text('pyyaml\n')
+    Path('pipeline.yaml').write_text('tasks: []\n')
+    source.archive(['pipeline.yaml'], 'dist/project.tar.gz', arcname='project')
+
+    sizes = {}
+
+    for multi_stage in [False, True]:
+        Path('Dockerfile').write_text(
+            render('aws-batch',
+                   conda=False,
+                   setup_py=False,
+                   multi_stage=multi_stage,
+                   buildkit=False))
+        sizes[multi_stage] = build_image(
+            f'soopervisor-test-multi-stage:{str(multi_stage).lower()}')
+
+    assert sizes[True] < sizes[False]
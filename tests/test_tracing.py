@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from soopervisor import tracing
+
+
+def test_span_does_nothing_if_not_recording():
+    with tracing.span('some span'):
+        pass
+
+
+def test_record(tmp_empty, capsys):
+    with tracing.record('trace.json'):
+        with tracing.span('outer'):
+            with tracing.span('inner'):
+                pass
+
+    trace = json.loads(Path('trace.json').read_text())
+    events = trace['traceEvents']
+    outer, inner = events
+
+    assert [e['name'] for e in events] == ['outer', 'inner']
+    assert outer['ts'] <= inner['ts']
+    assert outer['ts'] + outer['dur'] >= inner['ts'] + inner['dur']
+
+    captured = capsys.readouterr()
+    assert 'outer' in captured.out
+    assert '  inner' in captured.out
+
+
+def test_record_disabled(tmp_empty):
+    with tracing.record('trace.json', enabled=False):
+        with tracing.span('span'):
+            pass
+
+    assert not Path('trace.json').exists()